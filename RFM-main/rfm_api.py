@@ -0,0 +1,220 @@
+"""Local HTTP lookup service for customer RFM scores, segments and model predictions.
+
+Example:
+    python rfm_api.py --data rfm_data.csv --port 8000
+
+Endpoints:
+    GET  /customers/<id>                     one customer
+    GET  /customers?ids=1,2,3                batch lookup
+    POST /customers/batch  {"ids": [...]}    batch lookup
+    GET  /segments                           segment sizes
+    GET  /segments/<name>?offset=0&limit=100 segment members, paginated
+    GET  /rfm-scores?offset=0&limit=100      all customers, paginated
+    GET  /export?format=csv&segment=...      all customers streamed as csv, csv.gz or parquet,
+                                             filtered by segment, location, start and end
+    POST /refresh                            rebuild the index from the data file
+    GET  /metrics                            latency and throughput counters
+    GET  /health
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from rfm_data import DATA_FILE, load_transactions
+from rfm_export import EXPORT_FORMATS, MIME_TYPES, iter_chunks, select_customers, write_export
+from rfm_index import CustomerIndex
+from rfm_models import REGISTRY_DIR, ModelRegistry, customer_snapshot, model_scope
+from rfm_shared import SHARED_DIR, SharedFrameStore, frame_name
+
+MAX_PAGE_SIZE = 1000
+
+
+class RFMLookupService:
+    """Owns the current index, swaps in rebuilt ones atomically and keeps request counters."""
+
+    def __init__(self, data_path=DATA_FILE, registry_dir=REGISTRY_DIR, shared_dir=SHARED_DIR):
+        self.data_path = data_path
+        self.registry_dir = registry_dir
+        # Attaches the transactions the dashboard already published for the same file, if any
+        self.shared = SharedFrameStore(shared_dir) if shared_dir else None
+        self.started_at = time.time()
+        self.index = None
+        self._refresh_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {}
+
+    def refresh(self):
+        """Rebuild the index off to the side; readers keep the old one until the swap."""
+        with self._refresh_lock:
+            start = time.perf_counter()
+            data = self._transactions()
+            snapshot = customer_snapshot(data, ModelRegistry(self.registry_dir), model_scope(self.data_path))
+            version = (self.index.version + 1) if self.index else 1
+            # Purchase dates and locations behind the export filters travel with the index they match;
+            # rebinding one attribute is atomic, so requests see either the old or the new pair
+            self.index = CustomerIndex(snapshot, version, data[['CustomerID', 'PurchaseDate', 'Location']])
+            self.record('refresh', time.perf_counter() - start)
+            return self.index
+
+    def _transactions(self):
+        if self.shared is None:
+            return load_transactions(self.data_path)
+        name = frame_name(self.data_path, 'transactions')
+        version = os.path.getmtime(self.data_path)
+        data = self.shared.get_or_publish(name, version, lambda: load_transactions(self.data_path))
+        # The index is rebuilt from this version, so older files are no longer needed
+        self.shared.discard_other_versions(name, version)
+        return data
+
+    def refresh_async(self):
+        threading.Thread(target=self.refresh, name='rfm-index-refresh', daemon=True).start()
+
+    def record(self, endpoint, seconds):
+        with self._metrics_lock:
+            stats = self._metrics.setdefault(endpoint, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['count'] += 1
+            stats['total_ms'] += seconds * 1000
+            stats['max_ms'] = max(stats['max_ms'], seconds * 1000)
+
+    def metrics(self):
+        uptime = time.time() - self.started_at
+        with self._metrics_lock:
+            endpoints = {name: dict(stats, avg_ms=stats['total_ms'] / stats['count'])
+                         for name, stats in self._metrics.items()}
+        requests = sum(stats['count'] for name, stats in endpoints.items() if name != 'refresh')
+        index = self.index
+        return {'uptime_seconds': round(uptime, 1), 'requests': requests,
+                'requests_per_second': requests / uptime if uptime else 0.0,
+                'index_version': index.version if index else None,
+                'index_customers': len(index) if index else 0,
+                'endpoints': endpoints}
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _paging(self, query):
+            offset = max(int(query.get('offset', ['0'])[0]), 0)
+            limit = min(max(int(query.get('limit', ['100'])[0]), 1), MAX_PAGE_SIZE)
+            return offset, limit
+
+        def _dispatch(self, method):
+            start = time.perf_counter()
+            url = urlparse(self.path)
+            parts = [unquote(part) for part in url.path.strip('/').split('/') if part]
+            query = parse_qs(url.query)
+            endpoint = '/'.join(parts[:1]) or 'root'
+            self._streaming = False
+            try:
+                status, payload = self._route(method, parts, query)
+            except Exception as exc:
+                if self._streaming:
+                    # The 200 status and part of the body are already out; cut the body short instead
+                    self.close_connection = True
+                    status, payload = 500, None
+                elif isinstance(exc, (ValueError, KeyError, json.JSONDecodeError)):
+                    status, payload = 400, {'error': str(exc)}
+                else:
+                    status, payload = 500, {'error': f'{type(exc).__name__}: {exc}'}
+            # A None payload means the response body was already streamed
+            if payload is not None:
+                self._send(status, payload)
+            service.record(f'{method} /{endpoint}', time.perf_counter() - start)
+
+        def _list(self, query, name):
+            return [item for value in query.get(name, []) for item in value.split(',') if item]
+
+        # Stream the filtered snapshot chunk by chunk; the connection close ends the body
+        def _export(self, index, query):
+            fmt = query.get('format', ['csv'])[0]
+            if fmt not in EXPORT_FORMATS:
+                raise ValueError(f"Unknown export format '{fmt}', expected one of {EXPORT_FORMATS}")
+            start, end = query.get('start', [None])[0], query.get('end', [None])[0]
+            positions = select_customers(index.snapshot, index.activity, self._list(query, 'segment'),
+                                         self._list(query, 'location'), start, end)
+            self._streaming = True
+            self.send_response(200)
+            self.send_header('Content-Type', MIME_TYPES[fmt])
+            self.send_header('Content-Disposition', f'attachment; filename="rfm_scores.{fmt}"')
+            self.send_header('X-Total-Count', str(len(positions)))
+            self.end_headers()
+            write_export(iter_chunks(index.snapshot, positions), self.wfile, fmt)
+            return 200, None
+
+        def _route(self, method, parts, query):
+            index = service.index
+            if parts == ['health']:
+                return 200, {'status': 'ok', 'index_version': index.version if index else None}
+            if parts == ['metrics']:
+                return 200, service.metrics()
+            if method == 'POST' and parts == ['refresh']:
+                service.refresh_async()
+                return 202, {'status': 'refreshing'}
+            if index is None:
+                return 503, {'error': 'index not loaded yet'}
+
+            if parts[:1] == ['customers']:
+                if method == 'POST' and parts[1:] == ['batch']:
+                    length = int(self.headers.get('Content-Length', 0))
+                    ids = json.loads(self.rfile.read(length) or b'{}')['ids']
+                    return 200, index.get_many([int(cid) for cid in ids])
+                if len(parts) == 2:
+                    record = index.get(int(parts[1]))
+                    return (200, record) if record else (404, {'error': f'customer {parts[1]} not found'})
+                if 'ids' in query:
+                    return 200, index.get_many([int(cid) for cid in query['ids'][0].split(',') if cid])
+            if parts == ['segments']:
+                return 200, index.segment_sizes()
+            if parts[:1] == ['segments'] and len(parts) == 2:
+                return 200, dict(index.page(parts[1], *self._paging(query)), segment=parts[1])
+            if parts == ['rfm-scores']:
+                return 200, index.page(None, *self._paging(query))
+            if method == 'GET' and parts == ['export']:
+                return self._export(index, query)
+            return 404, {'error': 'not found'}
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=DATA_FILE, help='transaction CSV (default: %(default)s)')
+    parser.add_argument('--registry', default=REGISTRY_DIR, help='model registry directory (default: %(default)s)')
+    parser.add_argument('--shared-dir', default=SHARED_DIR,
+                        help="memory-mapped datasets shared with the dashboard (default: %(default)s, '' to disable)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    service = RFMLookupService(args.data, args.registry, args.shared_dir)
+    service.refresh()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving {len(service.index):,} customers on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
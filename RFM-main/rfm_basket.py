@@ -0,0 +1,87 @@
+"""Market-basket analysis over sparse order x product matrices with FP-Growth."""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from mlxtend.frequent_patterns import association_rules, fpgrowth
+from scipy import sparse
+
+from rfm_data import dataset_fingerprint
+from rfm_singleflight import SingleFlight
+
+
+# Boolean basket matrix (baskets x products) in CSR form, built from the distinct pairs only
+def build_basket_matrix(data, basket_key='OrderID', item_key='ProductInformation'):
+    basket_codes, baskets = pd.factorize(data[basket_key], sort=True)
+    item_codes, items = pd.factorize(data[item_key], sort=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(basket_codes), dtype=bool), (basket_codes, item_codes)),
+        shape=(len(baskets), len(items)))
+    # Duplicate (basket, item) pairs are summed by the constructor; clamp back to booleans
+    matrix.data[:] = True
+    return matrix, baskets, items
+
+
+# Frequent itemsets and association rules for a basket matrix
+def mine_rules(matrix, items, min_support=0.01, metric='lift', min_threshold=1.0, max_len=None):
+    n_baskets = matrix.shape[0]
+    if n_baskets == 0:
+        return pd.DataFrame(columns=['support', 'itemsets']), pd.DataFrame()
+
+    # Drop items that can never appear in a frequent itemset before building the FP-tree
+    item_support = np.asarray(matrix.sum(axis=0)).ravel() / n_baskets
+    keep = np.flatnonzero(item_support >= min_support)
+    basket_df = pd.DataFrame.sparse.from_spmatrix(
+        matrix[:, keep].tocsc(), columns=[str(item) for item in items[keep]])
+
+    itemsets = fpgrowth(basket_df, min_support=min_support, use_colnames=True, max_len=max_len)
+    if itemsets.empty or itemsets['itemsets'].map(len).max() < 2:
+        return itemsets, pd.DataFrame()
+    rules = association_rules(itemsets, num_itemsets=n_baskets, metric=metric, min_threshold=min_threshold)
+    return itemsets, rules.sort_values(metric, ascending=False, ignore_index=True)
+
+
+class BasketEngine:
+    """FP-Growth results cached per dataset version and mining parameters.
+
+    Concurrent requests for the same uncached result share one mining run.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def mine(self, data, basket_key='OrderID', item_key='ProductInformation', min_support=0.01,
+             metric='lift', min_threshold=1.0, max_len=None, fingerprint=None):
+        """Return ``(itemsets, rules)``; ``fingerprint`` skips hashing when the version is known."""
+        fingerprint = fingerprint or dataset_fingerprint(data[[basket_key, item_key]])
+        key = (fingerprint, basket_key, item_key, min_support, metric, min_threshold, max_len)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self._stats['hits'] += 1
+                return self._cache[key]
+            self._stats['misses'] += 1
+
+        def compute():
+            with self._lock:
+                if key in self._cache:
+                    return self._cache[key]
+            matrix, _, items = build_basket_matrix(data, basket_key, item_key)
+            result = mine_rules(matrix, items, min_support, metric, min_threshold, max_len)
+            with self._lock:
+                self._cache[key] = result
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+            return result
+        return self._flight.do(key, compute)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, cached=len(self._cache))
+        stats['coalesced'] = self._flight.stats()['coalesced']
+        return stats
@@ -0,0 +1,137 @@
+"""Headless batch scoring of the full customer base with a registered churn or CLV model.
+
+Example:
+    python rfm_batch_score.py --task churn --data rfm_data.csv --output churn_scores.parquet
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from rfm_data import DATA_FILE, REFERENCE_DATE, build_ml_features
+from rfm_models import (DEFAULT_LEARNER, LEARNERS, REGISTRY_DIR, TASK_FEATURES, ModelRegistry,
+                        model_scope, resolve_params, score_customers)
+
+# Model loaded once per worker process by _init_worker
+_worker_model = None
+
+# Columns written by score_customers after CustomerID
+SCORE_FIELDS = {
+    'churn': [('ChurnProbability', pa.float64()), ('ChurnPrediction', pa.int8())],
+    'clv': [('PredictedCLV', pa.float64())],
+}
+
+
+def score_schema(task, id_type):
+    return pa.schema([('CustomerID', id_type)] + SCORE_FIELDS[task])
+
+
+# Arrow type of the CustomerID column as pandas reads it from the head of the file;
+# a file without rows has no type to go by, so its IDs are written as strings
+def customer_id_type(data_path, sample_rows=10_000):
+    ids = pd.read_csv(data_path, usecols=['CustomerID'], nrows=sample_rows)
+    id_type = pa.Schema.from_pandas(ids, preserve_index=False).field('CustomerID').type
+    return pa.string() if pa.types.is_null(id_type) else id_type
+
+
+# Resolve the model to score with: an explicit registry key, else the newest default model
+# of the learner trained for the data file at `data_path`
+def load_model(registry_dir, task, key=None, learner=DEFAULT_LEARNER, data_path=None):
+    registry = ModelRegistry(registry_dir)
+    if key:
+        entry = registry.get(key)
+    else:
+        entry = registry.latest(task, TASK_FEATURES[task], resolve_params(learner), learner, model_scope(data_path))
+    if entry is None:
+        raise SystemExit(f"No registered {task} model found in '{registry_dir}'"
+                         + (f" for key {key}" if key else f" for {data_path}"))
+    return entry
+
+
+# Split transactions into on-disk partitions by customer, so every partition holds complete histories
+def partition_transactions(data_path, workdir, n_partitions, chunksize):
+    for i, chunk in enumerate(pd.read_csv(data_path, chunksize=chunksize)):
+        chunk['PurchaseDate'] = pd.to_datetime(chunk['PurchaseDate'])
+        # Hash so any ID type (numbers or strings) lands in the same partition in every chunk
+        bucket = pd.util.hash_array(chunk['CustomerID'].to_numpy()) % n_partitions
+        for part, rows in chunk.groupby(bucket):
+            part_dir = os.path.join(workdir, f'part-{part:05d}')
+            os.makedirs(part_dir, exist_ok=True)
+            rows.to_parquet(os.path.join(part_dir, f'chunk-{i:06d}.parquet'), index=False)
+    return sorted(os.path.join(workdir, name) for name in os.listdir(workdir))
+
+
+def _init_worker(registry_dir, task, key):
+    global _worker_model
+    _worker_model = load_model(registry_dir, task, key)
+
+
+# Worker: build `ml_data` features for one partition and score them
+def _score_partition(part_dir, task, reference_date):
+    model, meta = _worker_model
+    ml_data = build_ml_features(pd.read_parquet(part_dir), reference_date)
+    return score_customers(task, model, ml_data, meta['features'])
+
+
+def run(data_path, output, task, registry_dir=REGISTRY_DIR, key=None, workers=None,
+        partitions=64, chunksize=1_000_000, reference_date=REFERENCE_DATE, learner=DEFAULT_LEARNER):
+    start = time.perf_counter()
+    model_key = load_model(registry_dir, task, key, learner, data_path)[1]['key']
+    # One schema for every partition, with the ID type of the input
+    schema = score_schema(task, customer_id_type(data_path))
+    workdir = tempfile.mkdtemp(prefix='rfm-batch-')
+    writer = None
+    n_scored = 0
+    try:
+        part_dirs = partition_transactions(data_path, workdir, partitions, chunksize)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(registry_dir, task, model_key)) as pool:
+            futures = [pool.submit(_score_partition, part_dir, task, reference_date) for part_dir in part_dirs]
+            for future in futures:
+                table = pa.Table.from_pandas(future.result(), schema=schema, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output, schema)
+                writer.write_table(table)
+                n_scored += table.num_rows
+        if writer is None:
+            # No transactions: still leave a valid, empty score file behind
+            writer = pq.ParquetWriter(output, schema)
+    finally:
+        if writer is not None:
+            writer.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'task': task, 'model_key': model_key, 'customers': n_scored,
+            'seconds': round(time.perf_counter() - start, 2), 'output': output}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--task', choices=sorted(TASK_FEATURES), required=True)
+    parser.add_argument('--data', default=DATA_FILE, help='transaction CSV (default: %(default)s)')
+    parser.add_argument('--output', required=True, help='Parquet file to write scores to')
+    parser.add_argument('--registry', default=REGISTRY_DIR, help='model registry directory (default: %(default)s)')
+    parser.add_argument('--model-key', help='registry key of the model; defaults to the newest default model')
+    parser.add_argument('--learner', choices=sorted(LEARNERS), default=DEFAULT_LEARNER,
+                        help='learner of the default model when no key is given (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=None, help='scoring processes (default: CPU count)')
+    parser.add_argument('--partitions', type=int, default=64, help='customer partitions (default: %(default)s)')
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help='CSV rows read per chunk (default: %(default)s)')
+    parser.add_argument('--reference-date', type=pd.Timestamp, default=REFERENCE_DATE,
+                        help='reference date for Recency (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    summary = run(args.data, args.output, args.task, args.registry, args.model_key, args.workers,
+                  args.partitions, args.chunksize, args.reference_date, args.learner)
+    print(f"Scored {summary['customers']:,} customers with {summary['task']} model "
+          f"{summary['model_key']} in {summary['seconds']}s -> {summary['output']}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,462 @@
+"""Shared, memory-budgeted cache of per-tenant datasets and derived artifacts."""
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from rfm_cohorts import CohortEngine, build_cohorts, extend_cohorts
+from rfm_cube import ScoreCube
+from rfm_data import (DATA_FILE, RFM_WINDOWS, SEGMENT_ORDER, build_ml_features, compute_rfm, compute_rfm_windows,
+                      dataset_fingerprint, load_transactions, score_rfm, select_rfm_window)
+from rfm_diskcache import DEFAULT_MAX_MB, RESULT_CACHE_DIR, DiskCache
+from rfm_index import CustomerIndex, TransactionIndex, sort_transactions
+from rfm_models import TASK_FEATURES, attach_predictions, clv_training_set, latest_models, model_scope
+from rfm_shared import SHARED_DIR, SharedFrameStore, frame_name
+from rfm_sketch import DEFAULT_PRECISION, DistinctSketches
+from rfm_singleflight import SingleFlight
+
+TENANT_CONFIG_FILE = 'tenants.json'
+DEFAULT_TENANT = 'default'
+DEFAULT_GLOBAL_BUDGET_MB = 2048
+
+MB = 1024 * 1024
+
+
+# Approximate in-memory size of a cached value in bytes
+def estimate_size(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True, index=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (TransactionIndex, CustomerIndex, CohortEngine, DistinctSketches, ScoreCube)):
+        return sum(estimate_size(part) for part in vars(value).values())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (str, bytes, int, float, type(None))):
+        return sys.getsizeof(value)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'hits', 'created')
+
+    def __init__(self, value, size):
+        self.value = value
+        self.size = size
+        self.hits = 0
+        self.created = time.monotonic()
+
+
+class TenantCache:
+    """Key/value cache partitioned by tenant with per-tenant and global byte budgets.
+
+    Each tenant is capped by its own budget and evicts only its own entries to
+    stay under it. When the global budget is exceeded, victims come from the
+    tenant furthest above its reserved share, so a large tenant pays for its
+    own growth before anyone else's warm data is touched. Values larger than
+    a budget are returned to the caller but not cached. ``policy`` picks the
+    victim within a tenant: least recently used ('lru') or least frequently
+    used ('lfu'). Concurrent misses of the same key share one computation.
+    """
+
+    def __init__(self, global_budget=DEFAULT_GLOBAL_BUDGET_MB * MB, tenant_budgets=None,
+                 default_tenant_budget=None, reserved=None, policy='lru'):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f"Unknown policy '{policy}', expected 'lru' or 'lfu'")
+        self.global_budget = global_budget
+        self.tenant_budgets = dict(tenant_budgets or {})
+        self.default_tenant_budget = default_tenant_budget or global_budget
+        self.reserved = dict(reserved or {})
+        self.policy = policy
+        self._tenants = {}
+        self._usage = {}
+        self._lock = threading.RLock()
+        self._stats = {}
+        self._local = threading.local()
+        self.flight = SingleFlight()
+
+    def budget(self, tenant):
+        return min(self.tenant_budgets.get(tenant, self.default_tenant_budget), self.global_budget)
+
+    # Share of the global budget protected from other tenants' pressure
+    def reservation(self, tenant):
+        if tenant in self.reserved:
+            return self.reserved[tenant]
+        known = set(self._tenants) | set(self.tenant_budgets) | {tenant}
+        return min(self.budget(tenant), self.global_budget // len(known))
+
+    def _tenant_stats(self, tenant):
+        return self._stats.setdefault(tenant, {'hits': 0, 'misses': 0, 'evictions': 0, 'rejected': 0})
+
+    def _count(self, tenant, outcome):
+        self._tenant_stats(tenant)[outcome] += 1
+        local = self._local.__dict__.setdefault('stats', {})
+        local.setdefault(tenant, {'hits': 0, 'misses': 0})[outcome] += 1
+
+    def get(self, tenant, key, default=None):
+        with self._lock:
+            entries = self._tenants.get(tenant)
+            if entries is None or key not in entries:
+                self._count(tenant, 'misses')
+                return default
+            entry = entries[key]
+            entry.hits += 1
+            entries.move_to_end(key)
+            self._count(tenant, 'hits')
+            return entry.value
+
+    # Hit/miss counters of lookups made by the calling thread only, per tenant
+    def thread_stats(self):
+        return {tenant: dict(counts) for tenant, counts in getattr(self._local, 'stats', {}).items()}
+
+    def _victim(self, tenant):
+        entries = self._tenants[tenant]
+        if self.policy == 'lru':
+            return next(iter(entries))
+        return min(entries, key=lambda k: (entries[k].hits, entries[k].created))
+
+    def _evict(self, tenant):
+        key = self._victim(tenant)
+        entry = self._tenants[tenant].pop(key)
+        self._usage[tenant] -= entry.size
+        self._tenant_stats(tenant)['evictions'] += 1
+
+    def _global_victim_tenant(self, inserting):
+        over = [(self._usage[t] - self.reservation(t), t) for t, entries in self._tenants.items()
+                if entries and self._usage[t] > self.reservation(t)]
+        if over:
+            return max(over)[1]
+        return inserting if self._tenants.get(inserting) else None
+
+    def total_usage(self):
+        with self._lock:
+            return sum(self._usage.values())
+
+    def put(self, tenant, key, value, size=None):
+        """Cache ``value``; returns False when it cannot fit without breaking the budgets."""
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            entries = self._tenants.setdefault(tenant, OrderedDict())
+            self._usage.setdefault(tenant, 0)
+            if key in entries:
+                self._usage[tenant] -= entries.pop(key).size
+            if size > self.budget(tenant):
+                self._tenant_stats(tenant)['rejected'] += 1
+                return False
+
+            while entries and self._usage[tenant] + size > self.budget(tenant):
+                self._evict(tenant)
+            while self.total_usage() + size > self.global_budget:
+                victim = self._global_victim_tenant(tenant)
+                if victim is None:
+                    self._tenant_stats(tenant)['rejected'] += 1
+                    return False
+                self._evict(victim)
+
+            entries[key] = _Entry(value, size)
+            self._usage[tenant] += size
+            return True
+
+    def get_or_compute(self, tenant, key, compute, sizer=None):
+        """Cached value of ``key``, computing it on a miss; ``sizer`` overrides estimate_size."""
+        marker = object()
+        value = self.get(tenant, key, marker)
+        if value is not marker:
+            return value
+
+        def compute_once():
+            # The previous flight for this key may have stored it just before we got here
+            with self._lock:
+                entries = self._tenants.get(tenant)
+                if entries is not None and key in entries:
+                    return entries[key].value
+            value = compute()
+            self.put(tenant, key, value, None if sizer is None else sizer(value))
+            return value
+        return self.flight.do((tenant, key), compute_once)
+
+    def keys(self, tenant):
+        with self._lock:
+            return list(self._tenants.get(tenant, ()))
+
+    def invalidate(self, tenant, key=None):
+        with self._lock:
+            entries = self._tenants.get(tenant, {})
+            keys = list(entries) if key is None else [key] if key in entries else []
+            for k in keys:
+                self._usage[tenant] -= entries.pop(k).size
+
+    def stats(self):
+        with self._lock:
+            tenants = {}
+            for tenant in set(self._tenants) | set(self._stats):
+                stats = dict(self._tenant_stats(tenant))
+                lookups = stats['hits'] + stats['misses']
+                stats.update(entries=len(self._tenants.get(tenant, {})), bytes=self._usage.get(tenant, 0),
+                             budget=self.budget(tenant), hit_ratio=stats['hits'] / lookups if lookups else 0.0)
+                tenants[tenant] = stats
+            return {'bytes': self.total_usage(), 'global_budget': self.global_budget, 'tenants': tenants,
+                    'single_flight': self.flight.stats()}
+
+
+# Tenant definitions: {"global_budget_mb": ..., "shared_dir": path or null,
+#                      "result_cache_dir": path or null, "result_cache_mb": ..., "sketch_precision": ...,
+#                      "tenants": {name: {"data": path, "budget_mb": ...}}}
+def load_tenant_config(path=TENANT_CONFIG_FILE):
+    if os.path.exists(path):
+        with open(path) as fh:
+            config = json.load(fh)
+    else:
+        config = {}
+    config.setdefault('global_budget_mb', DEFAULT_GLOBAL_BUDGET_MB)
+    config.setdefault('shared_dir', SHARED_DIR)
+    config.setdefault('result_cache_dir', RESULT_CACHE_DIR)
+    config.setdefault('result_cache_mb', DEFAULT_MAX_MB)
+    config.setdefault('sketch_precision', DEFAULT_PRECISION)
+    config.setdefault('tenants', {DEFAULT_TENANT: {'data': DATA_FILE}})
+    return config
+
+
+class TenantDatasets:
+    """Tenant-scoped loaders whose results live in a shared TenantCache.
+
+    Every artifact is keyed on a data version, the modification time of the
+    tenant's data file. Until ``refresh`` has published a version, readers
+    follow the file directly, so a changed file is reloaded on next access.
+    Once a version is published, readers stay on it and ``refresh`` builds
+    the next one off to the side before switching them over.
+
+    With a ``shared_dir``, the transactions, the scored RFM table and the
+    sorted transactions behind the drill-down index are published there as
+    memory-mapped Arrow files. Every reader, in this process or another one
+    pointed at the same data file, attaches the same read-only pages, so
+    those frames are charged to the cache budgets only for their bookkeeping.
+
+    With a ``result_cache_dir``, the other tables (and the RFM table when
+    nothing is shared) are also written to a size-capped disk cache, so after
+    a restart ``warm_up`` reloads them instead of recomputing them. Disk
+    entries are keyed on the content fingerprint of the transactions, so a
+    redeployed or touched but unchanged file still finds them.
+    """
+
+    # Artifacts built before a new version is published
+    REFRESH_ARTIFACTS = ('transactions', 'rfm', 'rfm_windows', 'ml_features', 'sketches', 'monthly_rollup',
+                         'segment_counts', 'cohorts', 'transaction_index', 'customer_index')
+
+    # Per-window artifacts, built for every rfm_data.RFM_WINDOWS entry before a version is published
+    WINDOW_ARTIFACTS = ('window_rfm', 'score_cube')
+
+    # Artifacts published to the shared directory instead of built per process
+    SHARED_ARTIFACTS = ('transactions', 'rfm', 'transactions_sorted')
+
+    # Artifacts kept in the disk cache across restarts
+    PERSISTED_ARTIFACTS = ('rfm', 'rfm_windows', 'window_rfm', 'score_cube', 'ml_features', 'sketches',
+                           'monthly_rollup', 'segment_counts', 'cohorts')
+
+    def __init__(self, config=None, policy='lru'):
+        config = config or load_tenant_config()
+        self.sources = {name: spec['data'] for name, spec in config['tenants'].items()}
+        budgets = {name: int(spec['budget_mb'] * MB)
+                   for name, spec in config['tenants'].items() if 'budget_mb' in spec}
+        self.cache = TenantCache(int(config['global_budget_mb'] * MB), budgets, policy=policy)
+        shared_dir = config.get('shared_dir')
+        self.shared = SharedFrameStore(shared_dir) if shared_dir else None
+        result_dir = config.get('result_cache_dir')
+        self.disk = DiskCache(result_dir, int(config.get('result_cache_mb', DEFAULT_MAX_MB) * MB)) \
+            if result_dir else None
+        self.sketch_precision = config.get('sketch_precision', DEFAULT_PRECISION)
+        self._published = {}
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def tenants(self):
+        return list(self.sources)
+
+    def data_path(self, tenant):
+        if tenant not in self.sources:
+            raise KeyError(f"Unknown tenant '{tenant}'")
+        return self.sources[tenant]
+
+    def version(self, tenant):
+        published = self._published.get(tenant)
+        return published if published is not None else os.path.getmtime(self.data_path(tenant))
+
+    def refresh(self, tenant):
+        """Build every artifact for the file's current version, then publish it.
+
+        Returns True when a new version was published. Readers keep getting
+        the previous version until the swap and never wait on the rebuild.
+        """
+        with self._refresh_lock:
+            version = os.path.getmtime(self.data_path(tenant))
+            if self._published.get(tenant) == version:
+                return False
+            for artifact in self.REFRESH_ARTIFACTS:
+                getattr(self, artifact)(tenant, version)
+            for artifact in self.WINDOW_ARTIFACTS:
+                for window in RFM_WINDOWS:
+                    getattr(self, artifact)(tenant, window, version)
+            self._published[tenant] = version
+            for key in self.cache.keys(tenant):
+                if key[1] != version:
+                    self.cache.invalidate(tenant, key)
+            if self.shared is not None:
+                for kind in self.SHARED_ARTIFACTS:
+                    self.shared.discard_other_versions(frame_name(self.data_path(tenant), kind), version)
+            return True
+
+    def warm_up(self, registry=None):
+        """Build or reload every tenant's artifacts, and its models when a registry is given.
+
+        Meant to run before traffic arrives; returns {tenant: error message}
+        for the tenants that failed.
+        """
+        errors = {}
+        for tenant in self.tenants:
+            try:
+                self.refresh(tenant)
+                if registry is not None:
+                    for task in TASK_FEATURES:
+                        self.model(tenant, task, registry, background=False)
+            except Exception as exc:
+                errors[tenant] = f"{type(exc).__name__}: {exc}"
+        return errors
+
+    # Disk lookup keyed on the content fingerprint, which is only computed once the in-memory cache missed
+    def _persisted(self, tenant, kind, params, build):
+        return lambda v: self.disk.get_or_compute((kind, self.fingerprint(tenant, v)) + params, lambda: build(v))
+
+    def _cached(self, tenant, kind, build, version=None, *params, sizer=None):
+        version = self.version(tenant) if version is None else version
+        if self.disk is not None and kind in self.PERSISTED_ARTIFACTS \
+                and not (self.shared is not None and kind in self.SHARED_ARTIFACTS):
+            build = self._persisted(tenant, kind, params, build)
+        if self.shared is not None and kind in self.SHARED_ARTIFACTS:
+            name = frame_name(self.data_path(tenant), kind)
+            # Mapped pages belong to the OS page cache, not to this process; count only the overhead
+            return self.cache.get_or_compute(
+                tenant, (kind, version) + params,
+                lambda: self.shared.get_or_publish(name, version, lambda: build(version)),
+                sizer=lambda frame: int(frame.index.memory_usage(deep=True)))
+        return self.cache.get_or_compute(tenant, (kind, version) + params, lambda: build(version), sizer)
+
+    # Content hash of the transactions, computed once per version
+    def fingerprint(self, tenant, version=None):
+        return self._cached(tenant, 'fingerprint', lambda v: dataset_fingerprint(self.transactions(tenant, v)), version)
+
+    def transactions(self, tenant, version=None):
+        return self._cached(tenant, 'transactions', lambda v: load_transactions(self.data_path(tenant)), version)
+
+    def rfm(self, tenant, version=None):
+        return self._cached(tenant, 'rfm', lambda v: score_rfm(compute_rfm(self.transactions(tenant, v))), version)
+
+    # Recency/Frequency/Monetary for every lookback window in rfm_data.RFM_WINDOWS, one wide table
+    def rfm_windows(self, tenant, version=None):
+        return self._cached(tenant, 'rfm_windows', lambda v: compute_rfm_windows(self.transactions(tenant, v)), version)
+
+    # Scored RFM table of one lookback window, picked from rfm_windows
+    def window_rfm(self, tenant, window='all', version=None):
+        if window not in RFM_WINDOWS:
+            raise ValueError(f"Unknown window '{window}', expected one of {list(RFM_WINDOWS)}")
+        return self._cached(tenant, 'window_rfm',
+                            lambda v: score_rfm(select_rfm_window(self.rfm_windows(tenant, v), window)), version, window)
+
+    # R x F x M score cube of one lookback window, behind the segment views and what-if sliders
+    def score_cube(self, tenant, window='all', version=None):
+        if window not in RFM_WINDOWS:
+            raise ValueError(f"Unknown window '{window}', expected one of {list(RFM_WINDOWS)}")
+        return self._cached(tenant, 'score_cube',
+                            lambda v: ScoreCube(select_rfm_window(self.rfm_windows(tenant, v), window)), version, window)
+
+    def transactions_sorted(self, tenant, version=None):
+        return self._cached(tenant, 'transactions_sorted',
+                            lambda v: sort_transactions(self.transactions(tenant, v)), version)
+
+    def ml_features(self, tenant, version=None):
+        return self._cached(tenant, 'ml_features', lambda v: build_ml_features(self.transactions(tenant, v)), version)
+
+    # HyperLogLog sketches of distinct customers per day and location
+    def sketches(self, tenant, version=None):
+        return self._cached(tenant, 'sketches', lambda v: DistinctSketches(self.sketch_precision)
+                            .update(self.transactions(tenant, v)), version)
+
+    # Active customers (estimated from the sketches), orders and revenue per month
+    def monthly_rollup(self, tenant, version=None):
+        def build(v):
+            data = self.transactions(tenant, v)
+            rollup = data.groupby(data['PurchaseDate'].dt.to_period('M')).agg(
+                Total_Orders=('OrderID', 'count'),
+                Total_Revenue=('TransactionAmount', 'sum'))
+            rollup.insert(0, 'Active_Customers', self.sketches(tenant, v).count_by('M'))
+            return rollup
+        return self._cached(tenant, 'monthly_rollup', build, version)
+
+    # Customers per RFM segment, in SEGMENT_ORDER
+    def segment_counts(self, tenant, version=None):
+        return self._cached(tenant, 'segment_counts', lambda v: self.rfm(tenant, v)['RFM_Segment']
+                            .value_counts().reindex(SEGMENT_ORDER, fill_value=0), version)
+
+    def cohorts(self, tenant, version=None):
+        def build(v):
+            data = self.transactions(tenant, v)
+            # When the file only gained rows, extend the published version's engine instead of rebuilding
+            published = self._published.get(tenant)
+            engine = self.cache.get(tenant, ('cohorts', published)) if published not in (None, v) else None
+            engine = extend_cohorts(engine, data) if engine is not None else None
+            return engine if engine is not None else build_cohorts(data)
+        return self._cached(tenant, 'cohorts', build, version)
+
+    def transaction_index(self, tenant, version=None):
+        # The sorted frame is its own cache entry, so only the offsets count here
+        return self._cached(tenant, 'transaction_index',
+                            lambda v: TransactionIndex(self.transactions_sorted(tenant, v), presorted=True), version,
+                            sizer=lambda index: estimate_size(index._ids) + estimate_size(index._bounds))
+
+    def customer_index(self, tenant, version=None):
+        return self._cached(tenant, 'customer_index', lambda v: CustomerIndex(self.rfm(tenant, v)), version)
+
+    # Export rows: the scored RFM table plus predictions of the newest churn/CLV models trained for this tenant.
+    # Keyed on those models, so a retrained model is picked up without a data change.
+    def export_snapshot(self, tenant, registry, version=None):
+        models = latest_models(registry, model_scope(self.data_path(tenant)))
+        return self._cached(tenant, 'export_snapshot', lambda v: attach_predictions(
+            self.rfm(tenant, v), self.ml_features(tenant, v), models), version,
+            *(meta['key'] for _, meta in models.values()))
+
+    # Rows a task's model trains on: the ml_data snapshot for churn, point-in-time rows for CLV
+    def training_set(self, tenant, task, version=None):
+        if task == 'clv':
+            return self._cached(tenant, 'clv_training', lambda v: clv_training_set(self.transactions(tenant, v)),
+                                version)
+        return self.ml_features(tenant, version)
+
+    def model(self, tenant, task, registry, **kwargs):
+        """Registry-backed churn/CLV model for the tenant's current data version."""
+        version = self.version(tenant)
+        key = ('model', version, task, repr(sorted(kwargs.items())))
+        entry = self.cache.get(tenant, key)
+        if entry is not None:
+            return entry
+
+        def train():
+            entry = registry.get_or_train(self.training_set(tenant, task, version), self.fingerprint(tenant, version),
+                                          task, scope=model_scope(self.data_path(tenant)), **kwargs)
+            # A stale model is being replaced in the background; look it up again next time
+            if not entry[1].get('stale'):
+                self.cache.put(tenant, key, entry)
+            return entry
+        return self.cache.flight.do((tenant, key), train)
@@ -0,0 +1,266 @@
+"""Scalable clustering helpers for the customer feature matrix."""
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.cluster.hierarchy import dendrogram, fcluster, linkage
+from sklearn.base import BaseEstimator, ClusterMixin
+from sklearn.cluster import Birch
+from sklearn.neighbors import BallTree, KDTree
+
+
+# Build a spatial index, picking KD tree for low dimensional data
+def _build_tree(X, algorithm, leaf_size, metric):
+    if algorithm == 'auto':
+        algorithm = 'kd_tree' if X.shape[1] <= 15 and metric in KDTree.valid_metrics else 'ball_tree'
+    if algorithm == 'kd_tree':
+        return KDTree(X, leaf_size=leaf_size, metric=metric)
+    if algorithm == 'ball_tree':
+        return BallTree(X, leaf_size=leaf_size, metric=metric)
+    raise ValueError(f"Unknown algorithm '{algorithm}', expected 'auto', 'kd_tree' or 'ball_tree'")
+
+
+# Split range(n) into contiguous (start, stop) chunks
+def _chunks(n, chunk_size):
+    return [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+
+
+# Union-find root lookup by pointer jumping over a batch of nodes
+def _find(parent, nodes):
+    roots = parent[nodes]
+    while True:
+        next_roots = parent[roots]
+        if np.array_equal(next_roots, roots):
+            return roots
+        roots = next_roots
+
+
+# Merge the components of each (a, b) pair; roots always point to the lower index
+def _union(parent, a, b):
+    while len(a):
+        ra, rb = _find(parent, a), _find(parent, b)
+        pending = ra != rb
+        if not pending.any():
+            return
+        ra, rb = ra[pending], rb[pending]
+        # Conflicting writes to the same root keep one value; the losers retry
+        parent[np.maximum(ra, rb)] = np.minimum(ra, rb)
+        a, b = a[pending], b[pending]
+
+
+def ward_linkage(centers, sizes):
+    """Ward linkage matrix (scipy format) of weighted points.
+
+    Point ``i`` stands for ``sizes[i]`` observations at ``centers[i]``, so
+    merging clusters a and b costs ``n_a * n_b / (n_a + n_b) * ||c_a - c_b||**2``.
+    Heights follow scipy's convention, ``sqrt(2 * cost)``, and with unit sizes
+    the result equals ``linkage(centers, 'ward')``. Built with the
+    nearest-neighbour chain algorithm: O(n**2) time and O(n) extra memory.
+    """
+    centers = np.array(centers, dtype=np.float64)
+    sizes = np.asarray(sizes, dtype=np.float64).copy()
+    n = len(centers)
+    active = np.ones(n, dtype=bool)
+    merges = []
+    chain = []
+    for _ in range(n - 1):
+        while True:
+            if not chain:
+                chain.append(int(np.flatnonzero(active)[0]))
+            a = chain[-1]
+            cost = 2 * sizes[a] * sizes / (sizes[a] + sizes) * np.sum((centers - centers[a]) ** 2, axis=1)
+            cost[~active] = np.inf
+            cost[a] = np.inf
+            b = int(np.argmin(cost))
+            # On ties stay with the previous chain element, so the chain always ends in a reciprocal pair
+            if len(chain) > 1 and cost[chain[-2]] <= cost[b]:
+                b = chain[-2]
+            if len(chain) > 1 and b == chain[-2]:
+                break
+            chain.append(b)
+        chain = chain[:-2]
+        merges.append((a, b, np.sqrt(cost[b])))
+        # The merged cluster lives on in slot a
+        centers[a] = (sizes[a] * centers[a] + sizes[b] * centers[b]) / (sizes[a] + sizes[b])
+        sizes[a] += sizes[b]
+        active[b] = False
+
+    # Chain merges come out of height order; sort them and renumber clusters as scipy does
+    parent = np.arange(n)
+    label = np.arange(n)
+    leaves = np.ones(n, dtype=np.int64)
+    Z = np.empty((len(merges), 4))
+    for step, i in enumerate(sorted(range(len(merges)), key=lambda i: merges[i][2])):
+        a, b, height = merges[i]
+        ra, rb = _find(parent, np.array([a, b]))
+        Z[step] = (min(label[ra], label[rb]), max(label[ra], label[rb]), height, leaves[ra] + leaves[rb])
+        parent[rb] = ra
+        label[ra] = n + step
+        leaves[ra] += leaves[rb]
+    return Z
+
+
+class IndexedDBSCAN(ClusterMixin, BaseEstimator):
+    """DBSCAN backed by a KD/ball tree with chunked, parallel neighbourhood queries.
+
+    Only one chunk of neighbourhoods is materialised at a time, so memory stays
+    bounded by ``chunk_size`` instead of the full neighbourhood graph. Core
+    samples are kept after fitting so ``predict`` can label new customers
+    without refitting.
+    """
+
+    def __init__(self, eps=0.5, min_samples=5, metric='euclidean', algorithm='auto',
+                 leaf_size=40, chunk_size=10000, n_jobs=None):
+        self.eps = eps
+        self.min_samples = min_samples
+        self.metric = metric
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+    def _parallel(self, func, X):
+        # Stream chunk results back so only in-flight chunks are held in memory
+        parallel = Parallel(n_jobs=self.n_jobs, prefer='threads', return_as='generator')
+        return parallel(delayed(func)(X[start:stop], start) for start, stop in _chunks(len(X), self.chunk_size))
+
+    def fit(self, X, y=None):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if self.eps <= 0:
+            raise ValueError("eps must be positive")
+        n_samples = len(X)
+        tree = _build_tree(X, self.algorithm, self.leaf_size, self.metric)
+
+        # Pass 1: neighbour counts only, to find the core samples
+        counts = np.empty(n_samples, dtype=np.int64)
+        for start, chunk_counts in self._parallel(
+                lambda chunk, start: (start, tree.query_radius(chunk, self.eps, count_only=True)), X):
+            counts[start:start + len(chunk_counts)] = chunk_counts
+        core_indices = np.flatnonzero(counts >= self.min_samples)
+        components = X[core_indices]
+        self.core_sample_indices_ = core_indices
+        self.components_ = components
+        if not len(core_indices):
+            # Like sklearn's DBSCAN: without core samples every point is noise
+            self.core_labels_ = np.empty(0, dtype=np.intp)
+            self._core_tree = None
+            self.labels_ = np.full(n_samples, -1, dtype=np.intp)
+            return self
+        core_tree = _build_tree(components, self.algorithm, self.leaf_size, self.metric)
+
+        # Pass 2: connect core samples that lie within eps of each other
+        parent = np.arange(len(core_indices))
+
+        def core_edges(chunk, start):
+            neighbours = core_tree.query_radius(chunk, self.eps)
+            sizes = np.fromiter((len(ind) for ind in neighbours), dtype=np.int64, count=len(neighbours))
+            src = np.repeat(np.arange(start, start + len(chunk)), sizes)
+            dst = np.concatenate(neighbours) if len(neighbours) else np.empty(0, dtype=np.intp)
+            return src, dst
+
+        for src, dst in self._parallel(core_edges, components):
+            _union(parent, src, dst)
+
+        core_labels = np.unique(_find(parent, np.arange(len(core_indices))), return_inverse=True)[1]
+
+        self.core_labels_ = core_labels
+        self._core_tree = core_tree
+
+        # Pass 3: border points take the label of their nearest core sample
+        labels = np.full(n_samples, -1, dtype=np.intp)
+        labels[core_indices] = core_labels
+        border = np.flatnonzero((counts < self.min_samples) & (counts > 1))
+        if len(border):
+            labels[border] = self.predict(X[border])
+        self.labels_ = labels
+        return self
+
+    def predict(self, X):
+        """Label new samples from the fitted core samples; -1 marks noise."""
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        labels = np.full(len(X), -1, dtype=np.intp)
+        if not len(self.core_sample_indices_):
+            return labels
+        for start, dist, ind in self._parallel(
+                lambda chunk, start: (start, *self._core_tree.query(chunk, k=1)), X):
+            stop = start + len(dist)
+            within = dist[:, 0] <= self.eps
+            labels[start:stop][within] = self.core_labels_[ind[within, 0]]
+        return labels
+
+
+class MicroClusterHierarchy(BaseEstimator):
+    """Two-stage hierarchical segmentation: a BIRCH CF tree, then linkage on its leaves.
+
+    Customers are streamed through the CF tree in chunks, and the linkage
+    matrix is built over the micro-cluster centroids only. Memory is bounded
+    by the number of micro-clusters rather than the number of customers.
+    Every customer keeps the index of its leaf in ``micro_labels_``. With
+    ``method='ward'`` each micro-cluster enters the linkage with its customer
+    count, so the tree approximates customer-level Ward; other methods link
+    the centroids unweighted.
+    """
+
+    def __init__(self, threshold=0.5, branching_factor=50, method='ward',
+                 max_micro_clusters=5000, chunk_size=50000):
+        self.threshold = threshold
+        self.branching_factor = branching_factor
+        self.method = method
+        self.max_micro_clusters = max_micro_clusters
+        self.chunk_size = chunk_size
+
+    def partial_fit(self, X):
+        if not hasattr(self, 'birch_'):
+            self.birch_ = Birch(threshold=self.threshold, branching_factor=self.branching_factor,
+                                n_clusters=None, compute_labels=False)
+        X = np.asarray(X, dtype=np.float64)
+        for start, stop in _chunks(len(X), self.chunk_size):
+            self.birch_.partial_fit(X[start:stop])
+        n_leaves = len(self.birch_.subcluster_centers_)
+        if n_leaves > self.max_micro_clusters:
+            raise ValueError(
+                f"CF tree produced {n_leaves} micro-clusters (limit {self.max_micro_clusters}); "
+                "increase threshold to summarise more coarsely")
+        return self
+
+    def fit(self, X, y=None):
+        if hasattr(self, 'birch_'):
+            del self.birch_
+        self.partial_fit(X)
+        self.micro_labels_ = self.predict_micro(X)
+        self.micro_sizes_ = np.bincount(self.micro_labels_, minlength=len(self.birch_.subcluster_centers_))
+        self.linkage_matrix_ = self._linkage()
+        return self
+
+    def _linkage(self):
+        centers = self.birch_.subcluster_centers_
+        if len(centers) < 2:
+            return np.empty((0, 4))
+        if self.method == 'ward':
+            # A leaf no fitted customer maps to still needs a positive weight
+            return ward_linkage(centers, np.maximum(self.micro_sizes_, 1))
+        return linkage(centers, method=self.method)
+
+    def predict_micro(self, X):
+        """Map customers to the index of their nearest micro-cluster (leaf)."""
+        X = np.asarray(X, dtype=np.float64)
+        labels = np.empty(len(X), dtype=np.intp)
+        for start, stop in _chunks(len(X), self.chunk_size):
+            labels[start:stop] = self.birch_.predict(X[start:stop])
+        return labels
+
+    def segment_map(self, n_clusters):
+        """Segment id (1-based) for each micro-cluster when the tree is cut into n_clusters."""
+        if not len(self.linkage_matrix_):
+            return np.ones(len(self.birch_.subcluster_centers_), dtype=np.intp)
+        return fcluster(self.linkage_matrix_, n_clusters, criterion='maxclust')
+
+    def cut(self, n_clusters):
+        """Segment id for every fitted customer at the given number of segments."""
+        return self.segment_map(n_clusters)[self.micro_labels_]
+
+    def predict(self, X, n_clusters):
+        return self.segment_map(n_clusters)[self.predict_micro(X)]
+
+    def dendrogram(self, **kwargs):
+        """Dendrogram over the micro-clusters, with leaves labelled by customer count."""
+        kwargs.setdefault('labels', [f"{size:,}" for size in self.micro_sizes_])
+        return dendrogram(self.linkage_matrix_, **kwargs)
@@ -0,0 +1,129 @@
+"""Closed-form probabilistic CLV: BG/NBD for purchase counts and Gamma-Gamma for spend.
+
+Both models are fitted by maximum likelihood with NumPy/SciPy and scored
+in one vectorized pass, so they need no per-customer loops and no
+retraining beyond a few seconds of optimisation per data version.
+"""
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from scipy.special import gammaln, hyp2f1
+
+# Model time runs in weeks to keep the optimisation well conditioned
+DAYS_PER_PERIOD = 7.0
+
+
+# BG/NBD inputs from `ml_data`: repeat purchases x, time of last purchase t_x, customer age T, mean spend m
+def clv_inputs(ml_data):
+    tenure = ml_data['Tenure'].to_numpy(dtype=np.float64)
+    return pd.DataFrame({
+        'x': ml_data['Frequency'].to_numpy(dtype=np.float64) - 1,
+        't_x': tenure / DAYS_PER_PERIOD,
+        'T': (tenure + ml_data['Recency'].to_numpy(dtype=np.float64)) / DAYS_PER_PERIOD,
+        'm': ml_data['Monetary'].to_numpy(dtype=np.float64) / ml_data['Frequency'].to_numpy(dtype=np.float64),
+    }, index=ml_data.index)
+
+
+def _fit(negative_log_likelihood, n_params, penalizer):
+    def objective(log_params):
+        params = np.exp(log_params)
+        return negative_log_likelihood(params) + penalizer * np.sum(params ** 2)
+
+    result = minimize(objective, np.zeros(n_params), method='L-BFGS-B')
+    if not np.isfinite(result.fun):
+        raise RuntimeError(f"Likelihood optimisation failed: {result.message}")
+    return np.exp(result.x)
+
+
+class BetaGeoModel:
+    """BG/NBD model (Fader, Hardie & Lee 2005) of repeat purchases and dropout."""
+
+    def __init__(self, penalizer=0.0):
+        self.penalizer = penalizer
+
+    @staticmethod
+    def _log_likelihood(params, x, t_x, T):
+        r, alpha, a, b = params
+        a1 = gammaln(r + x) - gammaln(r) + r * np.log(alpha)
+        a2 = gammaln(a + b) + gammaln(b + x) - gammaln(b) - gammaln(a + b + x)
+        a3 = -(r + x) * np.log(alpha + T)
+        repeat = x > 0
+        a4 = np.full_like(x, -np.inf)
+        a4[repeat] = (np.log(a) - np.log(b + x[repeat] - 1)
+                      - (r + x[repeat]) * np.log(alpha + t_x[repeat]))
+        return a1 + a2 + np.logaddexp(a3, a4)
+
+    def fit(self, x, t_x, T):
+        x, t_x, T = (np.asarray(v, dtype=np.float64) for v in (x, t_x, T))
+        self.params_ = dict(zip(('r', 'alpha', 'a', 'b'), _fit(
+            lambda p: -self._log_likelihood(p, x, t_x, T).mean(), 4, self.penalizer)))
+        return self
+
+    def _dropout_odds(self, x, t_x, T):
+        r, alpha, a, b = (self.params_[k] for k in ('r', 'alpha', 'a', 'b'))
+        odds = np.zeros_like(x)
+        repeat = x > 0
+        odds[repeat] = (a / (b + x[repeat] - 1)
+                        * ((alpha + T[repeat]) / (alpha + t_x[repeat])) ** (r + x[repeat]))
+        return odds
+
+    def probability_alive(self, x, t_x, T):
+        x, t_x, T = (np.asarray(v, dtype=np.float64) for v in (x, t_x, T))
+        return 1.0 / (1.0 + self._dropout_odds(x, t_x, T))
+
+    def expected_purchases(self, t, x, t_x, T):
+        """Expected purchases in the next ``t`` periods given each customer's history."""
+        x, t_x, T = (np.asarray(v, dtype=np.float64) for v in (x, t_x, T))
+        r, alpha, a, b = (self.params_[k] for k in ('r', 'alpha', 'a', 'b'))
+        ratio = (alpha + T) / (alpha + T + t)
+        numerator = (a + b + x - 1) / (a - 1) * (
+            1 - ratio ** (r + x) * hyp2f1(r + x, b + x, a + b + x - 1, t / (alpha + T + t)))
+        return numerator / (1.0 + self._dropout_odds(x, t_x, T))
+
+
+class GammaGammaModel:
+    """Gamma-Gamma model (Fader, Hardie & Lee 2005) of average transaction value."""
+
+    def __init__(self, penalizer=0.0):
+        self.penalizer = penalizer
+
+    @staticmethod
+    def _log_likelihood(params, x, m):
+        p, q, v = params
+        return (gammaln(p * x + q) - gammaln(p * x) - gammaln(q) + q * np.log(v)
+                + (p * x - 1) * np.log(m) + p * x * np.log(x) - (p * x + q) * np.log(x * m + v))
+
+    def fit(self, x, m):
+        x, m = np.asarray(x, dtype=np.float64), np.asarray(m, dtype=np.float64)
+        # Only repeat customers with positive spend carry information about spend heterogeneity
+        use = (x > 0) & (m > 0)
+        if not use.any():
+            raise ValueError("Gamma-Gamma needs at least one repeat customer with positive spend")
+        scale = m[use].mean()
+        params = _fit(lambda prm: -self._log_likelihood(prm, x[use], m[use] / scale).mean(), 3, self.penalizer)
+        p, q, v = params
+        self.params_ = {'p': p, 'q': q, 'v': v * scale}
+        return self
+
+    def expected_spend(self, x, m):
+        """Expected average transaction value; one-off buyers get the population mean."""
+        x, m = np.asarray(x, dtype=np.float64), np.asarray(m, dtype=np.float64)
+        p, q, v = (self.params_[k] for k in ('p', 'q', 'v'))
+        population_mean = p * v / (q - 1) if q > 1 else np.nan
+        conditional = p * (v + x * m) / (p * x + q - 1)
+        return np.where(x > 0, conditional, population_mean)
+
+
+# Fit both models on `ml_data` and score every customer in one vectorized pass
+def probabilistic_clv(ml_data, horizon_days=365, penalizer=0.001):
+    inputs = clv_inputs(ml_data)
+    bgnbd = BetaGeoModel(penalizer).fit(inputs['x'], inputs['t_x'], inputs['T'])
+    gamma_gamma = GammaGammaModel(penalizer).fit(inputs['x'], inputs['m'])
+
+    horizon = horizon_days / DAYS_PER_PERIOD
+    scores = ml_data[['CustomerID']].copy()
+    scores['ProbabilityAlive'] = bgnbd.probability_alive(inputs['x'], inputs['t_x'], inputs['T'])
+    scores['ExpectedPurchases'] = bgnbd.expected_purchases(horizon, inputs['x'], inputs['t_x'], inputs['T'])
+    scores['ExpectedSpend'] = gamma_gamma.expected_spend(inputs['x'], inputs['m'])
+    scores['PredictedCLV'] = scores['ExpectedPurchases'] * scores['ExpectedSpend']
+    return scores, bgnbd, gamma_gamma
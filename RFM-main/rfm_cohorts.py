@@ -0,0 +1,138 @@
+"""Acquisition-cohort matrices: active customers, orders and revenue by months since first purchase."""
+import numpy as np
+import pandas as pd
+
+COHORT_MEASURES = ('active', 'orders', 'revenue')
+
+
+# Months since year 0 as integers, so month arithmetic is plain subtraction
+def month_number(dates):
+    return (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=np.int64)
+
+
+def month_label(number):
+    return f'{number // 12}-{number % 12 + 1:02d}'
+
+
+# Orders and revenue per (customer, month) pair
+def customer_months(data):
+    frame = pd.DataFrame({'CustomerID': data['CustomerID'].to_numpy(),
+                          'Month': month_number(data['PurchaseDate']),
+                          'Amount': data['TransactionAmount'].to_numpy()})
+    return frame.groupby(['CustomerID', 'Month'], sort=False).agg(
+        Orders=('Amount', 'size'), Revenue=('Amount', 'sum')).reset_index()
+
+
+class CohortEngine:
+    """Cohort x months-since-acquisition matrices, updatable month by month.
+
+    A customer's cohort is the month of their first purchase. The
+    transactions are reduced to one row per (customer, month), and each
+    pair is added to three dense arrays with a single ``bincount`` per
+    measure. ``update`` accepts the transactions from ``last_month``
+    onwards. It first takes that month back out, so a month that was only
+    partly loaded is rebuilt in full, and months before it are never
+    touched again.
+    """
+
+    def __init__(self):
+        self.first_month = pd.Series(dtype=np.int64)
+        self.start = None
+        self.last_month = None
+        self.settled_rows = 0
+        self._tail = None
+        self._tail_rows = 0
+        self._counts = {measure: np.zeros((0, 0)) for measure in COHORT_MEASURES}
+
+    def _grow(self, last_month):
+        span = last_month - self.start + 1
+        for measure, counts in self._counts.items():
+            grown = np.zeros((span, span))
+            grown[:counts.shape[0], :counts.shape[1]] = counts
+            self._counts[measure] = grown
+
+    def _add(self, pairs, sign=1):
+        cohort = self.first_month.to_numpy()[self.first_month.index.get_indexer(pairs['CustomerID'])]
+        span = self._counts['active'].shape[0]
+        cells = (cohort - self.start) * span + (pairs['Month'].to_numpy() - cohort)
+        weights = {'active': None, 'orders': pairs['Orders'].to_numpy(), 'revenue': pairs['Revenue'].to_numpy()}
+        for measure, counts in self._counts.items():
+            counts += sign * np.bincount(cells, weights[measure], minlength=span * span).reshape(span, span)
+
+    def update(self, data):
+        """Add transactions covering ``last_month`` and later; returns the engine."""
+        if data.empty:
+            return self
+        pairs = customer_months(data)
+        first = pairs.groupby('CustomerID')['Month'].min()
+        if self.last_month is not None:
+            if first.min() < self.last_month:
+                raise ValueError(f"Cohort update starts before the last month already added "
+                                 f"({month_label(self.last_month)})")
+            self._add(self._tail, sign=-1)
+            self.settled_rows += self._tail_rows
+        else:
+            self.start = int(first.min())
+
+        new = first[~first.index.isin(self.first_month.index)]
+        self.first_month = pd.concat([self.first_month, new]) if len(self.first_month) else new
+        self.last_month = max(self.last_month or 0, int(pairs['Month'].max()))
+        self._grow(self.last_month)
+        self._add(pairs)
+
+        in_tail = month_number(data['PurchaseDate']) == self.last_month
+        self._tail = pairs[pairs['Month'] == self.last_month]
+        self._tail_rows = int(in_tail.sum())
+        self.settled_rows += len(data) - self._tail_rows
+        return self
+
+    # Customers acquired per cohort
+    def cohort_sizes(self):
+        sizes = self._frame(self._counts['active'][:, 0])
+        return sizes[sizes > 0].astype(np.int64)
+
+    def matrix(self, measure='active', relative=False):
+        """Cohorts as rows ('YYYY-MM'), months since acquisition as columns.
+
+        ``relative`` divides each row by the cohort's size, which gives the
+        retention rate for 'active' and per-acquired-customer orders and
+        revenue. Cells not yet observed are NaN.
+        """
+        if measure not in COHORT_MEASURES:
+            raise ValueError(f"Unknown measure '{measure}', expected one of {COHORT_MEASURES}")
+        if self.start is None:
+            return pd.DataFrame()
+        counts = self._counts[measure].copy()
+        span = counts.shape[0]
+        # Cohort c can only have been observed for last_month - c months
+        counts[np.add.outer(np.arange(span), np.arange(span)) >= span] = np.nan
+        if relative:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                counts = counts / self._counts['active'][:, [0]]
+        matrix = self._frame(counts)
+        return matrix[self._counts['active'][:, 0] > 0]
+
+    def _frame(self, values):
+        index = pd.Index([month_label(self.start + i) for i in range(len(values))], name='Cohort')
+        if values.ndim == 1:
+            return pd.Series(values, index=index)
+        columns = pd.RangeIndex(values.shape[1], name='Months Since First Purchase')
+        return pd.DataFrame(values, index=index, columns=columns)
+
+
+# Engine over every transaction in `data`
+def build_cohorts(data):
+    return CohortEngine().update(data)
+
+
+# Copy of `engine` extended to the current transactions, or None when they are not an
+# append to what the engine has seen (earlier months changed), so a full build is needed
+def extend_cohorts(engine, data):
+    if engine.last_month is None:
+        return build_cohorts(data)
+    months = month_number(data['PurchaseDate'])
+    if int((months < engine.last_month).sum()) != engine.settled_rows:
+        return None
+    extended = CohortEngine()
+    extended.__dict__.update(engine.__dict__, _counts={m: c.copy() for m, c in engine._counts.items()})
+    return extended.update(data[months >= engine.last_month])
@@ -0,0 +1,92 @@
+"""R x F x M score cube: per-cell customer counts and sums behind every segment view."""
+import numpy as np
+import pandas as pd
+
+from rfm_data import LOWEST_SEGMENT, SEGMENT_LADDER, segment_scores
+
+# Quantile bins per dimension kept in the cube; any quantile count dividing it is exact
+CUBE_RESOLUTION = 60
+QUANTILE_CHOICES = tuple(q for q in range(2, 13) if CUBE_RESOLUTION % q == 0)
+
+CUBE_MEASURES = ('Recency', 'Frequency', 'Monetary')
+
+
+# Index of each value's quantile bin out of `resolution`, with pd.qcut's (a, b] bins
+def _fine_bins(values, resolution):
+    values = np.asarray(values, dtype=np.float64)
+    edges = np.quantile(values, np.arange(1, resolution) / resolution)
+    return np.searchsorted(edges, values, side='left')
+
+
+# The default 4-quantile ladder stretched to the 3..3q score range of `quantiles`
+def scale_ladder(quantiles, ladder=SEGMENT_LADDER):
+    return [(3 + round((threshold - 3) * (quantiles - 1) / 3), name) for threshold, name in ladder]
+
+
+class ScoreCube:
+    """Customer counts and Recency/Frequency/Monetary sums per fine quantile cell.
+
+    Each dimension is cut into ``resolution`` quantile bins with the same
+    edges ``pd.qcut`` would use. A score for any quantile count dividing
+    the resolution is a run of whole fine bins. Re-scoring and
+    re-segmenting with other quantile counts or segment thresholds
+    therefore only touches the occupied cells, never the customers. With
+    4 quantiles and the default ladder the result matches
+    ``rfm_data.score_rfm``.
+    """
+
+    def __init__(self, rfm, resolution=CUBE_RESOLUTION):
+        self.resolution = resolution
+        bins = [_fine_bins(rfm['Recency'], resolution),
+                _fine_bins(rfm['Frequency'].rank(method='first'), resolution),
+                _fine_bins(rfm['Monetary'], resolution)]
+        keys, inverse = np.unique(np.ravel_multi_index(bins, (resolution,) * 3), return_inverse=True)
+        self.cells = np.stack(np.unravel_index(keys, (resolution,) * 3), axis=1)
+        self.totals = {'Count': np.bincount(inverse, minlength=len(keys))}
+        for measure in CUBE_MEASURES:
+            self.totals[measure] = np.bincount(inverse, rfm[measure].to_numpy(dtype=np.float64), minlength=len(keys))
+
+    def __len__(self):
+        return int(self.totals['Count'].sum())
+
+    def scores(self, quantiles=4):
+        """R, F and M scores of every occupied cell, labelled like score_rfm."""
+        if self.resolution % quantiles:
+            raise ValueError(f"quantiles must divide the cube resolution {self.resolution}, got {quantiles}")
+        bins = self.cells // (self.resolution // quantiles)
+        return bins[:, 0] + 1, quantiles - bins[:, 1], quantiles - bins[:, 2]
+
+    def cell_table(self, quantiles=4, ladder=SEGMENT_LADDER):
+        """One row per occupied (R, F, M) score cell with its segment, customer count and sums."""
+        r, f, m = self.scores(quantiles)
+        codes = np.ravel_multi_index((r - 1, f - 1, m - 1), (quantiles,) * 3)
+        counts = np.bincount(codes, self.totals['Count'], minlength=quantiles ** 3)
+        occupied = np.flatnonzero(counts)
+        r, f, m = (axis + 1 for axis in np.unravel_index(occupied, (quantiles,) * 3))
+        table = pd.DataFrame({'R_Score': r, 'F_Score': f, 'M_Score': m, 'RFM_Score': r + f + m})
+        table['RFM_Segment'] = segment_scores(table['RFM_Score'], ladder)
+        table['Count'] = counts[occupied].astype(np.int64)
+        for measure in CUBE_MEASURES:
+            table[measure] = np.bincount(codes, self.totals[measure], minlength=quantiles ** 3)[occupied]
+        return table
+
+    def segment_summary(self, quantiles=4, ladder=SEGMENT_LADDER):
+        """Customers, revenue and average R/F/M per segment, in ladder order (empty segments included)."""
+        table = self.cell_table(quantiles, ladder)
+        summary = table.groupby('RFM_Segment', observed=False)[['Count'] + list(CUBE_MEASURES)].sum()
+        summary.index = summary.index.astype(str)
+        summary = summary.reindex([name for _, name in ladder] + [LOWEST_SEGMENT], fill_value=0)
+        count = summary['Count'].replace(0, np.nan)
+        return pd.DataFrame({
+            'Count': summary['Count'].astype(np.int64),
+            'Share': summary['Count'] / max(len(self), 1),
+            'Revenue': summary['Monetary'],
+            'Avg_Recency': summary['Recency'] / count,
+            'Avg_Frequency': summary['Frequency'] / count,
+            'Avg_Monetary': summary['Monetary'] / count,
+        }).rename_axis('RFM_Segment')
+
+    # Customers per total RFM score
+    def score_distribution(self, quantiles=4):
+        table = self.cell_table(quantiles)
+        return table.groupby('RFM_Score')['Count'].sum()
@@ -1,3 +1,6 @@
+import functools
+import io
+import os
 import pandas as pd
 import datetime as dt
 import plotly.express as px
@@ -14,7 +17,16 @@ import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 from prophet import Prophet
 from collections import defaultdict, Counter
+from urllib.parse import urlencode
 from mlxtend.frequent_patterns import apriori, association_rules
+from rfm_cache import TenantDatasets
+from rfm_cube import QUANTILE_CHOICES, scale_ladder
+from rfm_data import SEGMENT_ORDER
+from rfm_export import CHUNK_ROWS, EXPORT_DIR, EXPORT_FORMATS, MIME_TYPES, iter_chunks, select_customers, write_export
+from rfm_models import REGISTRY_DIR, ModelRegistry
+from rfm_profiling import Profiler
+from rfm_refresh import RefreshWorker
+from rfm_styles import compile_stylesheet, style_script
 
 # Set page configuration
 st.set_page_config(
@@ -23,55 +35,6 @@ st.set_page_config(
     layout="wide"
 )
 
-# Custom CSS for animations
-st.markdown("""
-<style>
-    .nav-link {
-        padding: 12px 20px;
-        margin: 8px 0;
-        border-radius: 12px;
-        background: rgba(255, 255, 255, 0.1);
-        transition: all 0.3s ease;
-        cursor: pointer;
-        display: block;
-        text-decoration: none;
-        color: inherit;
-    }
-    
-    .nav-link:hover {
-        background: rgba(255, 255, 255, 0.2);
-        padding-left: 30px;
-        transform: scale(1.02);
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-    }
-    
-    .nav-link.active {
-        background: rgba(255, 255, 255, 0.25);
-        font-weight: bold;
-        border-left: 4px solid #ff4b4b;
-    }
-    
-    .main-content {
-        animation: fadeIn 0.5s ease-out;
-    }
-    
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateY(20px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-    
-    .nav-icon {
-        display: inline-block;
-        margin-right: 8px;
-        transition: transform 0.3s ease;
-    }
-    
-    .nav-link:hover .nav-icon {
-        transform: scale(1.2);
-    }
-</style>
-""", unsafe_allow_html=True)
-
 # Add click sound JavaScript
 st.markdown("""
 <script>
@@ -98,6 +61,233 @@ if 'current_page' not in st.session_state:
 def change_page(page):
     st.session_state.current_page = page
 
+# Install the stylesheet bundle once per browser session; later calls only switch the
+# page/theme classes, and only when they change
+def apply_styles(page, theme='Light'):
+    css, version = compile_stylesheet()
+    applied = st.session_state.get('applied_styles')
+    if applied == (version, page, theme):
+        return
+    bundle = None if applied and applied[0] == version else css
+    components.html(style_script(bundle, version, page, theme), height=0)
+    st.session_state.applied_styles = (version, page, theme)
+
+# Datasets and indexes shared by all sessions, budgeted per tenant (see tenants.json)
+@st.cache_resource(show_spinner=False)
+def get_tenant_datasets():
+    return TenantDatasets()
+
+# Data refresh rates offered in the settings, in seconds
+REFRESH_RATES = {'Off': None, '1 minute': 60, '5 minutes': 300, '15 minutes': 900, '1 hour': 3600}
+
+# One background worker per server keeps the shared datasets up to date; its first
+# pass reloads the caches persisted by the previous run
+@st.cache_resource(show_spinner=False)
+def get_refresh_worker():
+    return RefreshWorker(get_tenant_datasets(), REFRESH_RATES['5 minutes'], warm_up=True).start()
+
+# Start warming up as soon as the first session loads the script, whichever page it opens
+get_refresh_worker()
+
+# Tenant of the current session; the picker only appears when several are configured
+def current_tenant():
+    tenants = get_tenant_datasets().tenants
+    if len(tenants) > 1:
+        return st.sidebar.selectbox("🏢 Tenant:", tenants, key='tenant')
+    return tenants[0]
+
+# Cached transactions of a tenant (by default the current one); a shallow copy so pages can
+# add columns freely. Pages that need the tenant again pass it in, as the picker may only
+# be drawn once per run.
+def load_tenant_transactions(tenant=None):
+    return get_tenant_datasets().transactions(tenant or current_tenant()).copy(deep=False)
+
+# Customer 360 drill-down: RFM profile plus purchase timeline, products and locations
+@st.fragment
+def show_customer_drilldown(tenant):
+    datasets = get_tenant_datasets()
+    customer_id = st.number_input('👤 Customer ID:', min_value=0, step=1, value=None, key='drilldown_customer')
+    if customer_id is None:
+        return
+
+    profile = datasets.customer_index(tenant).get(int(customer_id))
+    history = datasets.transaction_index(tenant).history(int(customer_id))
+    if history.empty:
+        st.warning(f"No transactions found for customer {int(customer_id)}.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("📅 Recency", f"{profile['Recency']} days" if profile else "n/a")
+    with col2:
+        st.metric("🔁 Frequency", len(history))
+    with col3:
+        st.metric("💰 Monetary", f"${history['TransactionAmount'].sum():,.2f}")
+    with col4:
+        st.metric("🏷️ Segment", profile['RFM_Segment'] if profile else "n/a",
+                  f"R{profile['R_Score']} F{profile['F_Score']} M{profile['M_Score']}" if profile else None)
+
+    fig = px.scatter(history, x='PurchaseDate', y='TransactionAmount', color='ProductInformation',
+                     symbol='Location', title='Purchase Timeline')
+    fig.update_layout(height=350)
+    st.plotly_chart(fig, use_container_width=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.dataframe(history.groupby('ProductInformation')['TransactionAmount'].agg(['count', 'sum']))
+    with col2:
+        st.dataframe(history.groupby('Location')['TransactionAmount'].agg(['count', 'sum']))
+
+# Start the next profiled stage of the running page; no-op when profiling is off
+def profile_mark(stage):
+    profiler = st.session_state.get('profiler')
+    if profiler is not None:
+        profiler.mark(stage)
+
+# Hit/miss counters of this session's script thread in the shared dataset cache, per tenant;
+# other sessions' lookups are not counted
+def track_cache_stats(profiler):
+    if not profiler.enabled:
+        return
+    cache = get_tenant_datasets().cache
+    thread_stats = cache.thread_stats()
+    # Every tenant the cache has seen, so one first looked up mid-run starts from zero
+    for tenant in set(cache.stats()['tenants']) | set(thread_stats):
+        stats = thread_stats.get(tenant, {'hits': 0, 'misses': 0})
+        profiler.track_cache(f'datasets:{tenant}', stats['hits'], stats['misses'])
+
+# Sidebar summary of the last profiled run
+def show_profiling_panel(summary):
+    with st.sidebar.expander("🩺 Profile", expanded=True):
+        st.metric("Total", f"{summary['total_ms']:,.0f} ms",
+                  f"peak {summary['peak_traced_mb']:,.1f} MB traced, process-wide", delta_color='off')
+        stages = pd.DataFrame(summary['stages'])
+        if not stages.empty:
+            st.dataframe(stages[['stage', 'ms', 'mem_delta_mb']].rename(columns={'mem_delta_mb': 'process Δ MB'}),
+                         hide_index=True)
+        st.caption("Memory is traced for the whole server process, so other sessions' work shows up too.")
+        for name, cache in summary['caches'].items():
+            st.caption(f"{name}: {cache['hits']} hits, {cache['misses']} misses "
+                       f"({cache['hit_ratio']:.0%} hit ratio) this run")
+        flight = get_tenant_datasets().cache.flight.stats()
+        st.caption(f"Shared computations: {flight['executed']} executed, {flight['coalesced']} coalesced "
+                   f"({flight['coalesced_ratio']:.0%}) since server start")
+
+# Page decorator: opt-in profiling of the whole run, logged to profile_log.jsonl
+def profiled_page(page_function):
+    @functools.wraps(page_function)
+    def wrapper(*args, **kwargs):
+        enabled = st.sidebar.toggle("🩺 Profiling", key='profiling')
+        profiler = Profiler(page_function.__name__, enabled).start()
+        st.session_state['profiler'] = profiler
+        track_cache_stats(profiler)
+        try:
+            return page_function(*args, **kwargs)
+        finally:
+            track_cache_stats(profiler)
+            summary = profiler.finish()
+            st.session_state.pop('profiler', None)
+            if summary:
+                show_profiling_panel(summary)
+    return wrapper
+
+# Largest export offered as a browser download: st.download_button holds the whole file in memory
+DOWNLOAD_ROWS = CHUNK_ROWS
+
+# Export of customer scores, segments and predictions from the tenant's cached tables. Small
+# selections download directly; larger ones are streamed chunk by chunk to a file on the server.
+@st.fragment
+def show_export_panel(tenant):
+    datasets = get_tenant_datasets()
+    data = datasets.transactions(tenant)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        segments = st.multiselect("Segments:", SEGMENT_ORDER, key='export_segments')
+        locations = st.multiselect("Locations:", sorted(data['Location'].unique()), key='export_locations')
+    with col2:
+        window = st.date_input("Purchase window:", (), key='export_window')
+        fmt = st.selectbox("Format:", EXPORT_FORMATS, key='export_format')
+    start, end = (tuple(window) + (None, None))[:2]
+
+    # The cached RFM table has the export's rows in the same CustomerID order, so it sizes the selection
+    selected = len(select_customers(datasets.rfm(tenant), data, segments, locations, start, end))
+
+    def export_chunks():
+        snapshot = datasets.export_snapshot(tenant, ModelRegistry(REGISTRY_DIR))
+        return iter_chunks(snapshot, select_customers(snapshot, data, segments, locations, start, end))
+
+    # Runs on click only, so page reruns never pay for the export
+    def build_download():
+        output = io.BytesIO()
+        write_export(export_chunks(), output, fmt)
+        return output.getvalue()
+
+    if selected <= DOWNLOAD_ROWS:
+        st.download_button(f"📥 Download {selected:,} customers", build_download,
+                           file_name=f'rfm_scores.{fmt}', mime=MIME_TYPES[fmt])
+    else:
+        st.info(f"{selected:,} customers selected. Browser downloads are limited to {DOWNLOAD_ROWS:,} "
+                "customers; narrow the filters, or write the export to a file on the server.")
+        if st.button("💾 Write on server", key='export_to_server'):
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            name = f'rfm_scores-{tenant}-{dt.datetime.now():%Y%m%d-%H%M%S}.{fmt}'
+            path = os.path.abspath(os.path.join(EXPORT_DIR, name))
+            rows = write_export(export_chunks(), path)
+            st.success(f"Wrote {rows:,} customers to {path}")
+        query = urlencode({'format': fmt, 'segment': segments, 'location': locations,
+                           'start': start or '', 'end': end or ''}, doseq=True)
+        st.caption(f"The lookup service streams the same export: GET /export?{query} (python rfm_api.py)")
+
+# Distinct active customers over any date range and set of locations, by merging the
+# per-day, per-location sketches instead of scanning the transactions
+@st.fragment
+def show_active_customers(tenant):
+    sketches = get_tenant_datasets().sketches(tenant)
+    if not len(sketches.days):
+        return
+    first, last = sketches.days[0].date(), sketches.days[-1].date()
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        window = st.date_input("Activity window:", (first, last), min_value=first, max_value=last,
+                               key='active_window')
+    with col2:
+        locations = st.multiselect("Locations:", list(sketches.locations), key='active_locations')
+    start, end = (tuple(window) + (None, None))[:2]
+    with col3:
+        st.metric("👥 Active Customers", f"~{sketches.count(start, end, locations):,}",
+                  help=f"HyperLogLog estimate, ±{sketches.relative_error:.1%} typical error")
+
+# Lookback windows offered on the RFM Analysis page, see rfm_data.RFM_WINDOWS
+RFM_WINDOW_LABELS = {'Last 90 days': '90d', 'Last 180 days': '180d', 'Last 365 days': '365d', 'All time': 'all'}
+
+# Measures offered by the cohort heatmap
+COHORT_MEASURE_LABELS = {'Active Customers': 'active', 'Orders': 'orders', 'Revenue': 'revenue'}
+
+# Acquisition cohorts by months since first purchase, from the tenant's cached cohort engine
+@st.fragment
+def show_cohort_heatmap(tenant):
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        label = st.radio("Measure:", list(COHORT_MEASURE_LABELS), horizontal=True, key='cohort_measure')
+    with col2:
+        relative = st.toggle("Per acquired customer", value=True, key='cohort_relative')
+
+    measure = COHORT_MEASURE_LABELS[label]
+    matrix = get_tenant_datasets().cohorts(tenant).matrix(measure, relative)
+    if relative:
+        text = '.0%' if measure == 'active' else ('.2f' if measure == 'orders' else '$,.0f')
+        title = 'Retention Rate' if measure == 'active' else f'{label} per Acquired Customer'
+    else:
+        text = '$,.0f' if measure == 'revenue' else ',.0f'
+        title = label
+    fig = px.imshow(matrix, text_auto=text, aspect='auto', color_continuous_scale='Blues',
+                    labels={'x': 'Months Since First Purchase', 'y': 'Acquisition Cohort', 'color': title},
+                    title=f'{title} by Acquisition Cohort')
+    fig.update_xaxes(dtick=1)
+    fig.update_layout(height=max(400, 28 * len(matrix)))
+    st.plotly_chart(fig, use_container_width=True)
+
 # Enhanced navigation function
 def show_navigation():
     st.sidebar.title("📱 Navigation")
@@ -114,54 +304,33 @@ def show_navigation():
         # Using columns for better click detection
         col1, col2 = st.sidebar.columns([1, 0.1])
         with col1:
+            # The active page is a primary button, highlighted by the shared stylesheet
             if st.button(
                 f"{icon} {page}",
                 key=f"nav_{page}",
                 help=f"Navigate to {page}",
+                type='primary' if st.session_state.current_page == page else 'secondary',
                 use_container_width=True,
                 on_click=change_page,
                 args=(page,)
             ):
                 pass
-        
-        # Add the styling for the active state
-        if st.session_state.current_page == page:
-            st.sidebar.markdown(f"""
-                <style>
-                    div[data-testid="stButton"] button[kind="secondary"] {{
-                        background-color: rgba(255, 255, 255, 0.25);
-                        border-left: 4px solid #ff4b4b;
-                        font-weight: bold;
-                    }}
-                </style>
-                """, unsafe_allow_html=True)
 
 # Dashboard page
+@profiled_page
 def show_dashboard():
     st.title("📊 RFM Analysis Dashboard")
+    apply_styles('dashboard')
     
-    # Load the data
-    df = pd.read_csv('rfm_data.csv')
-    
-    # Convert PurchaseDate to datetime
-    df['PurchaseDate'] = pd.to_datetime(df['PurchaseDate'])
-    
-    # Define reference date for recency calculation
-    reference_date = dt.datetime(2023, 7, 1)
-    
-    # Calculate RFM metrics
-    rfm = df.groupby('CustomerID').agg({
-        'PurchaseDate': lambda x: (reference_date - x.max()).days,
-        'OrderID': 'count',
-        'TransactionAmount': 'sum'
-    }).reset_index()
-    
-    rfm.columns = ['CustomerID', 'Recency', 'Frequency', 'Monetary']
-    
-    # Filter out non-positive monetary values
-    rfm = rfm[rfm['Monetary'] > 0]
+    # Load the scored RFM table and its score cube
+    profile_mark('load')
+    tenant = current_tenant()
+    datasets = get_tenant_datasets()
+    rfm = datasets.rfm(tenant).copy(deep=False)
+    cube = datasets.score_cube(tenant)
     
     # Create three columns for key metrics
+    profile_mark('kpis')
     col1, col2, col3 = st.columns(3)
     
     with col1:
@@ -188,18 +357,15 @@ def show_dashboard():
         )
     
     # Create two columns for charts
+    profile_mark('charts')
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("Customer Distribution by RFM Score")
-        # Calculate RFM score
-        rfm['R_Score'] = pd.qcut(rfm['Recency'], 4, ['1', '2', '3', '4'])
-        rfm['F_Score'] = pd.qcut(rfm['Frequency'].rank(method='first'), 4, ['4', '3', '2', '1'])
-        rfm['M_Score'] = pd.qcut(rfm['Monetary'], 4, ['4', '3', '2', '1'])
-        rfm['RFM_Score'] = rfm[['R_Score', 'F_Score', 'M_Score']].sum(axis=1).astype(int)
-        
-        fig = px.histogram(rfm, x='RFM_Score', nbins=20,
-                          title='Distribution of Customer RFM Scores')
+        score_distribution = cube.score_distribution()
+        fig = px.bar(x=score_distribution.index, y=score_distribution.values,
+                     labels={'x': 'RFM_Score', 'y': 'count'},
+                     title='Distribution of Customer RFM Scores')
         fig.update_layout(height=400)
         st.plotly_chart(fig, use_container_width=True)
     
@@ -212,789 +378,23 @@ def show_dashboard():
         st.plotly_chart(fig, use_container_width=True)
     
     # Customer Segments Analysis
+    profile_mark('segmentation')
     st.subheader("Customer Segments Analysis")
-    # Define RFM segments
-    def rfm_segment(df):
-        if df['RFM_Score'] >= 9:
-            return 'Champions'
-        elif df['RFM_Score'] >= 8:
-            return 'Loyal Customers'
-        elif df['RFM_Score'] >= 7:
-            return 'Potential Loyalists'
-        elif df['RFM_Score'] >= 6:
-            return 'Recent Customers'
-        elif df['RFM_Score'] >= 5:
-            return 'Promising'
-        elif df['RFM_Score'] >= 4:
-            return 'Need Attention'
-        elif df['RFM_Score'] >= 3:
-            return 'At Risk'
-        else:
-            return 'Lost'
-    
-    rfm['Customer_Segment'] = rfm.apply(rfm_segment, axis=1)
-    segments = rfm['Customer_Segment'].value_counts()
+    segments = cube.segment_summary()['Count']
+    segments = segments[segments > 0]
     fig = px.pie(values=segments.values, names=segments.index,
                  title='Distribution of Customer Segments')
     st.plotly_chart(fig, use_container_width=True)
     
-    # Top Customers Table
-    st.subheader("Top 10 Customers by Value")
-    top_customers = rfm.nlargest(10, 'Monetary')[['CustomerID', 'Monetary', 'Recency', 'Customer_Segment']]
-    st.dataframe(top_customers)
-
-# Main RFM Analysis page
-def show_rfm_analysis():
-    # Define a function to get translations based on the selected language
-    def get_translations(language):
-        translations = {
-            'English': {
-                'title': 'RFM Analysis',
-                'theme': 'Theme Settings',
-                'refresh_rate': 'Data Refresh Rate',
-                'notifications': 'Notification Preferences',
-                'language': 'Language Settings'
-            },
-            'Spanish': {
-                'title': 'RFM Analysis',
-                'theme': 'Configuración de Tema',
-                'refresh_rate': 'Frecuencia de Actualización de Datos',
-                'notifications': 'Preferencias de Notificación',
-                'language': 'Configuración de Idioma'
-            },
-            'French': {
-                'title': 'RFM Analysis',
-                'theme': 'Paramètres de Thème',
-                'refresh_rate': 'Fréquence de Rafraîchissement des Données',
-                'notifications': 'Préférences de Notification',
-                'language': 'Paramètres de Langue'
-            },
-            'German': {
-                'title': 'RFM Analysis',
-                'theme': 'Thema Einstellungen',
-                'refresh_rate': 'Datenaktualisierungsrate',
-                'notifications': 'Benachrichtigungseinstellungen',
-                'language': 'Spracheinstellungen'
-            },
-            'Hindi': {
-                'title': 'RFM Analysis',
-                'theme': 'थीम सेटिंग्स',
-                'refresh_rate': 'डेटा रीफ्रेश दर',
-                'notifications': 'सूचना प्राथमिकताएँ',
-                'language': 'भाषा सेटिंग्स'
-            },
-            'Punjabi': {
-                'title': 'RFM Analysis',
-                'theme': 'ਥੀਮ ਸੈਟਿੰਗਜ਼',
-                'refresh_rate': 'ਡਾਟਾ ਰੀਫ੍ਰੈਸ਼ ਦਰ',
-                'notifications': 'ਸੂਚਨਾ ਪ੍ਰਾਥਮਿਕਤਾਵਾਂ',
-                'language': 'ਭਾਸ਼ਾ ਸੈਟਿੰਗਜ਼'
-            }
-        }
-        return translations.get(language, translations['English'])
-
-    # Load data
-    file_path = 'rfm_data.csv'  # Change this to the actual path if necessary
-    data = pd.read_csv(file_path)
-
-    # Convert PurchaseDate to datetime
-    data['PurchaseDate'] = pd.to_datetime(data['PurchaseDate'])
-
-    # Define reference date for recency calculation
-    reference_date = dt.datetime(2023, 7, 1)
-
-    # Calculate RFM metrics
-    rfm = data.groupby('CustomerID').agg({
-        'PurchaseDate': lambda x: (reference_date - x.max()).days,
-        'OrderID': 'count',
-        'TransactionAmount': 'sum'
-    }).reset_index()
-
-    rfm.columns = ['CustomerID', 'Recency', 'Frequency', 'Monetary']
-
-    # Filter out non-positive monetary values
-    rfm = rfm[rfm['Monetary'] > 0]
-
-    # Define RFM score thresholds
-    rfm['R_Score'] = pd.qcut(rfm['Recency'], 4, ['1', '2', '3', '4'])
-    rfm['F_Score'] = pd.qcut(rfm['Frequency'].rank(method='first'), 4, ['4', '3', '2', '1'])
-    rfm['M_Score'] = pd.qcut(rfm['Monetary'], 4, ['4', '3', '2', '1'])
-
-    # Concatenate RFM score to a single RFM segment
-    rfm['RFM_Segment'] = rfm['R_Score'].astype(str) + rfm['F_Score'].astype(str) + rfm['M_Score'].astype(str)
-    rfm['RFM_Score'] = rfm[['R_Score', 'F_Score', 'M_Score']].sum(axis=1).astype(int)
-
-    # Define RFM segments
-    def rfm_segment(df):
-        if df['RFM_Score'] >= 9:
-            return 'Champions'
-        elif df['RFM_Score'] >= 8:
-            return 'Loyal Customers'
-        elif df['RFM_Score'] >= 7:
-            return 'Potential Loyalists'
-        elif df['RFM_Score'] >= 6:
-            return 'Recent Customers'
-        elif df['RFM_Score'] >= 5:
-            return 'Promising'
-        elif df['RFM_Score'] >= 4:
-            return 'Need Attention'
-        elif df['RFM_Score'] >= 3:
-            return 'At Risk'
-        else:
-            return 'Lost'
-
-    rfm['RFM_Segment'] = rfm.apply(rfm_segment, axis=1)
-
-    # Count of customers in each segment
-    segment_counts = rfm['RFM_Segment'].value_counts().reset_index()
-    segment_counts.columns = ['RFM_Segment', 'Count']
-
-    # Streamlit Dashboard
-
-    # Add custom CSS with animations
-    st.markdown("""
-        <style>
-        @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@400;500;600;700&display=swap');
-        
-        @keyframes fadeIn {
-            from { opacity: 0; transform: translateY(20px); }
-            to { opacity: 1; transform: translateY(0); }
-        }
-        
-        @keyframes pulse {
-            0% { transform: scale(1); }
-            50% { transform: scale(1.05); }
-            100% { transform: scale(1); }
-        }
-
-        * {
-            font-family: 'Poppins', sans-serif;
-        }
-
-        .stApp {
-            background: linear-gradient(135deg, #EEF2FF 0%, #E0E7FF 100%);
-            animation: fadeIn 1.5s ease-out;
-        }
-
-        .header {
-            text-align: center;
-            padding: 2rem 0;
-            background: linear-gradient(120deg, #6a11cb 0%, #2575fc 100%);
-            border-radius: 15px;
-            margin-bottom: 2rem;
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-        }
-
-        .header h1 {
-            font-size: 3.2em;
-            color: white;
-            font-weight: 700;
-            margin-bottom: 0.5rem;
-            text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.2);
-            animation: fadeIn 2s ease-out;
-        }
-
-        .header p {
-            color: rgba(255, 255, 255, 0.9);
-            font-size: 1.1em;
-            margin: 0.5rem 0;
-        }
-
-        .header img {
-            width: 70px;
-            margin: 1rem 0;
-            animation: pulse 2s infinite;
-        }
-
-        .metric-container {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 1.5rem;
-            padding: 1rem;
-            animation: fadeIn 1s ease-out;
-        }
-
-        .metric {
-            background: linear-gradient(135deg, #F0F7FF 0%, #E5F0FF 100%);
-            border-radius: 15px;
-            padding: 1.5rem;
-            box-shadow: 0 4px 20px rgba(0, 0, 0, 0.08);
-            transition: transform 0.3s ease, box-shadow 0.3s ease;
-        }
-
-        .metric:hover {
-            transform: translateY(-5px);
-            box-shadow: 0 6px 25px rgba(0, 0, 0, 0.12);
-        }
-
-        .metric h3 {
-            color: #2575fc;
-            font-size: 1.1em;
-            font-weight: 600;
-            margin-bottom: 0.8rem;
-        }
-
-        .metric p {
-            font-size: 2.2em;
-            color: #6a11cb;
-            font-weight: 700;
-            margin: 0;
-        }
-
-        .stButton>button {
-            background: linear-gradient(120deg, #6a11cb 0%, #2575fc 100%);
-            color: white !important;
-            padding: 0.8rem 2rem;
-            border: none;
-            border-radius: 10px;
-            font-weight: 500;
-            font-size: 1.1em;
-            transition: all 0.3s ease;
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-            width: auto;
-            margin: 1rem auto;
-            display: block;
-        }
-
-        .stButton>button:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 6px 20px rgba(0, 0, 0, 0.15);
-            background: linear-gradient(120deg, #5a0cb1 0%, #1565ec 100%);
-        }
-
-        .plot-container {
-            background: linear-gradient(135deg, #F5F8FF 0%, #EDF2FF 100%);
-            border-radius: 15px;
-            padding: 1.5rem;
-            box-shadow: 0 4px 20px rgba(0, 0, 0, 0.08);
-            margin: 2rem 0;
-            animation: fadeIn 1.5s ease-out;
-        }
-
-        .segment {
-            background: linear-gradient(135deg, #F0F7FF 0%, #E5F0FF 100%);
-            border-radius: 15px;
-            padding: 2rem;
-            margin: 2rem 0;
-            box-shadow: 0 4px 20px rgba(0, 0, 0, 0.08);
-            text-align: center;
-        }
-
-        .segment h3 {
-            color: #6a11cb;
-            font-size: 1.8em;
-            font-weight: 600;
-            margin-bottom: 1rem;
-        }
-
-        .segment p {
-            color: #4a5568;
-            font-size: 1.1em;
-        }
-
-        /* Sidebar styling */
-        .css-1d391kg {
-            background: linear-gradient(180deg, #6a11cb 0%, #2575fc 100%);
-        }
-
-        .css-1d391kg .stSelectbox label {
-            color: white !important;
-            font-weight: 500;
-        }
-
-        .stSelectbox select {
-            background: white;
-            border-radius: 8px;
-            border: none;
-            color: #2575fc !important;
-            font-weight: 500;
-        }
-
-        /* Custom scrollbar */
-        ::-webkit-scrollbar {
-            width: 8px;
-        }
-
-        ::-webkit-scrollbar-track {
-            background: #f1f1f1;
-            border-radius: 4px;
-        }
-
-        ::-webkit-scrollbar-thumb {
-            background: linear-gradient(120deg, #6a11cb 0%, #2575fc 100%);
-            border-radius: 4px;
-        }
-
-        ::-webkit-scrollbar-thumb:hover {
-            background: linear-gradient(120deg, #5a0cb1 0%, #1565ec 100%);
-        }
-
-        /* Custom styling for data preview table */
-        .dataframe {
-            font-family: 'Poppins', sans-serif !important;
-            width: 100% !important;
-            border-collapse: separate !important;
-            border-spacing: 0 !important;
-            border-radius: 15px !important;
-            overflow: hidden !important;
-            box-shadow: 0 4px 20px rgba(0, 0, 0, 0.08) !important;
-            margin: 2rem 0 !important;
-            animation: fadeIn 1s ease-out !important;
-            border: 1px solid #e0e0e0 !important;
-            background-color: #F8FAFF !important;
-        }
-
-        .dataframe thead {
-            background: linear-gradient(120deg, #2c3e50 0%, #3498db 100%) !important;
-        }
-
-        .dataframe thead th {
-            padding: 1rem !important;
-            font-weight: 600 !important;
-            text-align: left !important;
-            font-size: 1.1em !important;
-            border: none !important;
-            color: #e8f4ff !important;
-            text-transform: uppercase !important;
-            letter-spacing: 0.5px !important;
-        }
-
-        .dataframe tbody tr {
-            transition: all 0.3s ease !important;
-            background-color: #F0F7FF !important;
-        }
-
-        .dataframe tbody tr:nth-child(even) {
-            background-color: #E5F0FF !important;
-        }
-
-        .dataframe tbody tr:hover {
-            background-color: #D1E5FF !important;
-            transform: translateX(5px) !important;
-        }
-
-        .dataframe tbody td {
-            padding: 0.8rem 1rem !important;
-            border: none !important;
-            font-size: 1em !important;
-            color: #1e293b !important;
-            border-bottom: 1px solid #e0e0e0 !important;
-        }
-
-        /* Style for the data preview container */
-        .data-preview-container {
-            background: linear-gradient(135deg, #e2e8f0 0%, #cbd5e1 100%) !important;
-            border-radius: 15px !important;
-            padding: 2rem !important;
-            margin: 2rem 0 !important;
-            box-shadow: 0 4px 20px rgba(0, 0, 0, 0.08) !important;
-        }
-
-        .data-preview-header {
-            color: #1e293b !important;
-            font-size: 1.8em !important;
-            font-weight: 600 !important;
-            margin-bottom: 1rem !important;
-            text-align: center !important;
-        }
-
-        .data-preview-description {
-            color: #334155 !important;
-            font-size: 1.1em !important;
-            text-align: center !important;
-            margin-bottom: 2rem !important;
-        }
-
-        /* Enhanced search box styling */
-        .search-container {
-            margin: 2rem 0 !important;
-            background: linear-gradient(135deg, #EEF2FF 0%, #E0E7FF 100%) !important;
-            padding: 2rem !important;
-            border-radius: 15px !important;
-            box-shadow: 0 4px 20px rgba(99, 102, 241, 0.15) !important;
-            border: 1px solid #C7D2FE !important;
-        }
-
-        /* Search input label styling */
-        .search-container .stTextInput label {
-            color: #FF6B6B !important;
-            font-weight: 600 !important;
-            font-size: 1.3em !important;
-            font-family: 'Poppins', sans-serif !important;
-            margin-bottom: 1rem !important;
-            text-transform: none !important;
-            letter-spacing: 0.5px !important;
-            background: linear-gradient(135deg, #FF6B6B 0%, #FF8E53 100%) !important;
-            -webkit-background-clip: text !important;
-            -webkit-text-fill-color: transparent !important;
-            padding: 0.5rem 0 !important;
-            display: block !important;
-            position: relative !important;
-        }
-
-        /* Search input label emoji styling */
-        .search-container .stTextInput label span {
-            color: #FF6B6B !important;
-            font-size: 1.4em !important;
-            margin-right: 0.8rem !important;
-            vertical-align: middle !important;
-            background: linear-gradient(135deg, #FF6B6B 0%, #FF8E53 100%) !important;
-            -webkit-background-clip: text !important;
-            -webkit-text-fill-color: transparent !important;
-        }
-
-        /* Search input field styling */
-        .search-container .stTextInput input {
-            font-family: 'Poppins', sans-serif !important;
-            font-size: 1.1em !important;
-            padding: 1.2rem 1.5rem !important;
-            border-radius: 12px !important;
-            border: 2px solid #FFB4AC !important;
-            background-color: #FFF0EE !important;
-            color: #E53E3E !important;
-            transition: all 0.3s ease !important;
-            width: 100% !important;
-            margin-top: 0.5rem !important;
-            box-shadow: 0 2px 10px rgba(255, 107, 107, 0.1) !important;
-        }
-
-        /* Search input hover state */
-        .search-container .stTextInput input:hover {
-            border-color: #FF6B6B !important;
-            box-shadow: 0 4px 12px rgba(255, 107, 107, 0.2) !important;
-            background-color: #ffffff !important;
-        }
-
-        /* Search input focus state */
-        .search-container .stTextInput input:focus {
-            border-color: #FF6B6B !important;
-            box-shadow: 0 0 0 3px rgba(255, 107, 107, 0.3) !important;
-            outline: none !important;
-            background-color: #ffffff !important;
-        }
-
-        /* Search input placeholder */
-        .search-container .stTextInput input::placeholder {
-            color: #FF8E53 !important;
-            opacity: 0.8 !important;
-            font-size: 1em !important;
-        }
-
-        /* Force color for the search label */
-        .search-container [data-testid="stTextInput"] label p {
-            background: linear-gradient(135deg, #FF6B6B 0%, #FF8E53 100%) !important;
-            -webkit-background-clip: text !important;
-            -webkit-text-fill-color: transparent !important;
-            font-weight: 600 !important;
-            display: inline-block !important;
-            position: relative !important;
-        }
-
-        /* Style for the search icon */
-        .search-container .stTextInput .st-emotion-cache-1gulkj5 {
-            background: linear-gradient(135deg, #FF6B6B 0%, #FF8E53 100%) !important;
-            -webkit-background-clip: text !important;
-            -webkit-text-fill-color: transparent !important;
-            font-size: 1.2em !important;
-        }
-
-        /* Add a subtle animation to the search container */
-        .search-container {
-            animation: fadeInUp 0.5s ease-out !important;
-        }
-
-        @keyframes fadeInUp {
-            from {
-                opacity: 0;
-                transform: translateY(10px);
-            }
-            to {
-                opacity: 1;
-                transform: translateY(0);
-            }
-        }
-
-        /* Add a subtle transition effect to the input */
-        .search-container .stTextInput input {
-            transition: all 0.3s ease-in-out !important;
-        }
-
-        /* Enhanced pagination styling */
-        .pagination-container {
-            background: #f0f4f8 !important;
-            padding: 1rem !important;
-            border-radius: 10px !important;
-            box-shadow: 0 2px 10px rgba(0, 0, 0, 0.05) !important;
-            margin: 1rem 0 !important;
-            display: flex !important;
-            justify-content: center !important;
-            align-items: center !important;
-        }
-
-        .pagination-container .stButton>button {
-            background: #2c3e50 !important;
-            color: #e2e8f0 !important;
-            border: none !important;
-            padding: 0.5rem 1rem !important;
-            border-radius: 8px !important;
-            transition: all 0.3s ease !important;
-            font-weight: 500 !important;
-        }
-
-        .pagination-container .stButton>button:hover:not([disabled]) {
-            background: #3498db !important;
-            color: #f0f4f8 !important;
-            transform: translateY(-2px) !important;
-        }
-
-        .pagination-container .stButton>button:disabled {
-            background: #94a3b8 !important;
-            color: #475569 !important;
-            cursor: not-allowed !important;
-        }
-
-        .page-info {
-            font-family: 'Poppins', sans-serif !important;
-            color: #1e293b !important;
-            font-size: 1.1em !important;
-            font-weight: 500 !important;
-            text-align: center !important;
-        }
-
-        /* Stats cards styling */
-        .stats-container {
-            background: linear-gradient(135deg, #F0F7FF 0%, #E5F0FF 100%) !important;
-            padding: 1.5rem !important;
-            border-radius: 12px !important;
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.05) !important;
-            margin: 1.5rem 0 !important;
-        }
-
-        .stats-container .stMetric {
-            background: linear-gradient(135deg, #F5F8FF 0%, #EDF2FF 100%) !important;
-            border: 1px solid #e2e8f0 !important;
-            transition: all 0.3s ease !important;
-        }
-
-        .stats-container .stMetric:hover {
-            transform: translateY(-3px) !important;
-            box-shadow: 0 6px 20px rgba(0, 0, 0, 0.1) !important;
-        }
-
-        /* Metric styling for stats container */
-        .stats-container .stMetric label {
-            color: #1a202c !important;  /* Dark color for label */
-            font-size: 1.1em !important;
-            font-weight: 600 !important;
-            font-family: 'Poppins', sans-serif !important;
-        }
-
-        .stats-container .stMetric [data-testid="stMetricValue"] {
-            color: #000000 !important;  /* Black color for the value */
-            font-size: 1.8em !important;
-            font-weight: 700 !important;
-            font-family: 'Poppins', sans-serif !important;
-        }
-
-        .stats-container .stMetric [data-testid="stMetricDelta"] {
-            color: red !important;  /* Red color for any delta values */
-            font-weight: 600 !important;
-        }
-
-        /* General metric styling */
-        .stMetric {
-            background: linear-gradient(135deg, #f0f4f8 0%, #e2e8f0 100%) !important;
-            padding: 1rem !important;
-            border-radius: 10px !important;
-            border: 1px solid #cbd5e0 !important;
-            margin: 0.5rem !important;
-        }
-
-        .stMetric label {
-            color: #1a202c !important;  /* Dark color for label */
-            font-size: 1.1em !important;
-            font-weight: 600 !important;
-            font-family: 'Poppins', sans-serif !important;
-        }
-
-        .stMetric [data-testid="stMetricValue"] {
-            color: #000000 !important;  /* Black color for the value */
-            font-size: 1.8em !important;
-            font-weight: 700 !important;
-            font-family: 'Poppins', sans-serif !important;
-        }
-
-        .stMetric [data-testid="stMetricDelta"] {
-            color: red !important;  /* Red color for any delta values */
-            font-weight: 600 !important;
-        }
-
-        /* Emoji icon styling */
-        .stats-container .stMetric label span {
-            font-size: 1.2em !important;
-            color: #1a202c !important;  /* Dark color for emoji */
-        }
-
-        /* Additional styling for metric containers */
-        [data-testid="stMetricValue"] > div {
-            color: #000000 !important;  /* Ensure nested divs also have black text */
-        }
-
-        [data-testid="stMetricLabel"] {
-            color: #1a202c !important;  /* Dark color for all metric labels */
-        }
-
-        /* Ensure all metric text is visible */
-        .stMetric div {
-            color: #000000 !important;  /* Force all div text in metrics to be black */
-        }
-
-        .stMetric span {
-            color: #1a202c !important;  /* Force all span text in metrics to be dark */
-        }
-
-        /* Toggle button styling */
-        .toggle-button-container {
-            text-align: center !important;
-            margin: 2rem 0 !important;
-        }
-
-        .toggle-button-container .stButton>button {
-            background: linear-gradient(120deg, #2c3e50 0%, #3498db 100%) !important;
-            color: #e2e8f0 !important;
-            padding: 0.8rem 2rem !important;
-            font-size: 1.1em !important;
-            border-radius: 8px !important;
-            border: none !important;
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1) !important;
-            transition: all 0.3s ease !important;
-            font-weight: 500 !important;
-        }
-
-        .toggle-button-container .stButton>button:hover {
-            transform: translateY(-2px) !important;
-            box-shadow: 0 6px 20px rgba(0, 0, 0, 0.15) !important;
-            background: linear-gradient(120deg, #34495e 0%, #2980b9 100%) !important;
-            color: #f0f4f8 !important;
-        }
-
-        /* Navbar Styling */
-        .navbar {
-            background: linear-gradient(120deg, #2c3e50 0%, #3498db 100%);
-            padding: 1rem 2rem;
-            margin-bottom: 2rem;
-            border-radius: 15px;
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }
-
-        .nav-items {
-            display: flex;
-            gap: 2rem;
-            align-items: center;
-        }
-
-        .nav-item {
-            color: white;
-            text-decoration: none;
-            display: flex;
-            align-items: center;
-            gap: 0.5rem;
-            font-size: 1.1em;
-            transition: all 0.3s ease;
-            padding: 0.5rem 1rem;
-            border-radius: 8px;
-        }
-
-        .nav-item:hover {
-            background: rgba(255, 255, 255, 0.1);
-            transform: translateY(-2px);
-        }
-
-        .nav-logo {
-            font-size: 1.5em;
-            font-weight: 700;
-            color: white;
-            display: flex;
-            align-items: center;
-            gap: 0.5rem;
-        }
-
-        /* Top Performing Segments styling */
-        .top-segments-header {
-            color: #000000 !important;
-            font-size: 1.8em !important;
-            font-weight: 600 !important;
-            margin: 1.5rem 0 !important;
-            display: flex !important;
-            align-items: center !important;
-            gap: 0.5rem !important;
-        }
-
-        /* Update dark theme background color for better visibility */
-        .stApp {
-            background: linear-gradient(135deg, #EEF2FF 0%, #E0E7FF 100%);
-        }
-
-        .segment, .data-preview-container, .stats-container, .header, .navbar, .nav-item, .nav-logo {
-            color: #1e293b;
-        }
-
-        .stMetric [data-testid="stMetricDelta"] {
-            color: red !important;  /* Red color for any delta values */
-            font-weight: 600 !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
-    # Initialize translations based on the selected language
-    language = st.sidebar.selectbox("Language:", ('English', 'Spanish', 'French', 'German', 'Hindi', 'Punjabi'))
-    translations = get_translations(language)
-
-    # Update the navbar to cover the full width and ensure links are functional
-    st.markdown(f"""
-    <div class="navbar">
-        <div class="nav-logo">
-            📊 <span style='color: #32CD32;'>RFM Analysis</span>
-        </div>
-        <div class="nav-items">
-            <a href="#dashboard" class="nav-item">
-                <i class="fas fa-chart-line"></i> Dashboard
-            </a>
-            <a href="#customers" class="nav-item">
-                <i class="fas fa-users"></i> Customers
-            </a>
-            <a href="#revenue" class="nav-item">
-                <i class="fas fa-dollar-sign"></i> Revenue
-            </a>
-            <a href="#settings" class="nav-item">
-                <i class="fas fa-cog"></i> Settings
-            </a>
-            <button class="translate-button nav-item" onclick="toggleTranslate()" fdprocessedid="3fmhjf">
-                🌐
-            </button>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-
-    # Ensure Font Awesome is loaded for icons
-    st.markdown("""
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css">
-    """, unsafe_allow_html=True)
-
-    # Header with enhanced styling
-    st.markdown("""
-    <div class='header'>
-        <h1>✨ <span style='color: #32CD32;'>RFM Analysis</span></h1>
-        <img src='https://img.icons8.com/fluency/96/000000/customer-insight.png'/>
-        <p>RFM Analysis Dashboard</p>
-        <p>Analyze customer segments based on Recency, Frequency, and Monetary values</p>
-    </div>
-    """, unsafe_allow_html=True)
+    # Top Customers Table
+    profile_mark('top_customers')
+    st.subheader("Top 10 Customers by Value")
+    top_customers = rfm.nlargest(10, 'Monetary')[['CustomerID', 'Monetary', 'Recency', 'RFM_Segment']]
+    st.dataframe(top_customers)
 
-    # Data Preview Button with Toggle and Enhanced Display
+# Interactive transaction preview; search and paging rerun only this section
+@st.fragment
+def show_data_preview(data, tenant):
     if 'data_preview' not in st.session_state:
         st.session_state.data_preview = False
         st.session_state.page_number = 0
@@ -1062,14 +462,19 @@ def show_rfm_analysis():
         with col1:
             st.metric("📊 Total Records", len(filtered_data))
         with col2:
-            st.metric("👥 Unique Customers", filtered_data['CustomerID'].nunique())
+            # Without a search the estimate comes from the tenant's distinct-customer sketches
+            unique_customers = filtered_data['CustomerID'].nunique() if search else \
+                f"~{get_tenant_datasets().sketches(tenant).count():,}"
+            st.metric("👥 Unique Customers", unique_customers)
         with col3:
             st.metric("📅 Date Range", f"{filtered_data['PurchaseDate'].min().strftime('%Y-%m-%d')} to {filtered_data['PurchaseDate'].max().strftime('%Y-%m-%d')}")
         with col4:
             st.metric("💰 Total Revenue", f"${filtered_data['TransactionAmount'].sum():,.2f}")
         st.markdown("</div>", unsafe_allow_html=True)
 
-    # Metrics
+# KPI header of the RFM Analysis page
+@st.fragment
+def show_rfm_kpis(rfm):
     total_customers = rfm['CustomerID'].nunique()
     avg_recency = int(rfm['Recency'].mean())
     avg_frequency = int(rfm['Frequency'].mean())
@@ -1096,116 +501,60 @@ def show_rfm_analysis():
     </div>
     """, unsafe_allow_html=True)
 
-    # Dropdown for analysis type
-    st.sidebar.title("Analysis Options")
-    analysis_type = st.sidebar.selectbox("Choose Analysis Type:", [
+# Update all graph layouts with black text and better colors
+def update_graph_layout(fig):
+    fig.update_layout(
+        font=dict(color='black', size=12, family='Poppins'),
+        title_font=dict(color='black', size=24),
+        plot_bgcolor='rgba(240, 247, 255, 0.5)',
+        paper_bgcolor='rgba(240, 247, 255, 0.5)',
+        xaxis=dict(
+            title_font=dict(color='black', size=14),
+            tickfont=dict(color='black', size=12),
+            gridcolor='rgba(0, 0, 0, 0.1)'
+        ),
+        yaxis=dict(
+            title_font=dict(color='black', size=14),
+            tickfont=dict(color='black', size=12),
+            gridcolor='rgba(0, 0, 0, 0.1)'
+        ),
+        legend=dict(
+            font=dict(color='black', size=12),
+            bgcolor='rgba(240, 247, 255, 0.5)'
+        )
+    )
+    return fig
+
+# What-if quantile count and segment thresholds; the defaults reproduce the standard quartile segments
+def segment_controls():
+    with st.expander("🎚️ What-if Segmentation"):
+        quantiles = st.select_slider("Score quantiles per dimension", options=QUANTILE_CHOICES, value=4,
+                                     key='whatif_quantiles')
+        ladder = []
+        columns = st.columns(4)
+        for i, (threshold, name) in enumerate(scale_ladder(quantiles)):
+            with columns[i % 4]:
+                threshold = st.slider(f"{name} from", 3, 3 * quantiles, threshold,
+                                      key=f'whatif_{quantiles}_{i}')
+            ladder.append((threshold, name))
+    return quantiles, ladder
+
+# Analysis chart; switching the analysis type or moving a what-if slider reruns only this section
+@st.fragment
+def show_analysis_chart(data, rfm, cube):
+    quantiles, ladder = segment_controls()
+    # Segment views come from the score cube, so re-segmenting touches cells, not customers
+    summary = cube.segment_summary(quantiles, ladder)
+
+    analysis_type = st.selectbox("Choose Analysis Type:", [
         "Customer Segmentation Overview",
         "Purchase Pattern Analysis",
         "Customer Value Distribution",
         "Segment Performance Metrics",
         "Customer Loyalty Trends",
         "Revenue Impact Analysis"
-    ])
-
-    # Add settings section below analysis options in the sidebar
-    st.sidebar.title("Settings")
-
-    # Theme selection
-    st.sidebar.subheader("Select Mode")
-    theme = st.sidebar.radio("Mode:", ('Light', 'Dark'))
-
-    # Update dark theme background color to Pistachio
-    new_dark_theme = {
-        'background': 'linear-gradient(135deg, #93c572 0%, #a2d149 100%)',  # Pistachio
-        'text_color': '#1e293b'
-    }
-
-    # Slightly darken the light theme background color
-    light_theme = {
-        'background': 'linear-gradient(135deg, #e5e5c4 0%, #e0d68c 100%)',  # Slightly darker beige
-        'text_color': '#1e293b'
-    }
-
-    # Apply selected theme
-    selected_theme = new_dark_theme if theme == 'Dark' else light_theme
-
-    # Update CSS dynamically
-    st.markdown(f"""
-        <style>
-        .stApp {{
-            background: {selected_theme['background']};
-        }}
-        .segment, .data-preview-container, .stats-container, .header, .navbar, .nav-item, .nav-logo {{
-            color: {selected_theme['text_color']};
-        }}
-        </style>
-    """, unsafe_allow_html=True)
-
-    # Update page content based on selected language
-    translations = get_translations(language)
-
-    # Update all text elements with translations
-    # st.markdown(f"""
-    # <div class='header'>
-    #     <h1>✨ {translations['title']}</h1>
-    #     <p>{translations['theme']}</p>
-    #     <p>{translations['refresh_rate']}</p>
-    #     <p>{translations['notifications']}</p>
-    #     <p>{translations['language']}</p>
-    # </div>
-    # """, unsafe_allow_html=True)
-
-    # Update navbar with translations
-    st.markdown(f"""
-    <div class="navbar">
-        <div class="nav-logo">
-            📊 <span style='color: #32CD32;'>RFM Analysis</span>
-        </div>
-        <div class="nav-items">
-            <a href="#dashboard" class="nav-item">
-                <i class="fas fa-chart-line"></i> {translations['theme']}
-            </a>
-            <a href="#customers" class="nav-item">
-                <i class="fas fa-users"></i> {translations['refresh_rate']}
-            </a>
-            <a href="#revenue" class="nav-item">
-                <i class="fas fa-dollar-sign"></i> {translations['notifications']}
-            </a>
-            <a href="#settings" class="nav-item">
-                <i class="fas fa-cog"></i> {translations['language']}
-            </a>
-            <button class="translate-button nav-item" onclick="toggleTranslate()" fdprocessedid="3fmhjf">
-                🌐
-            </button>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-
-    # Update all graph layouts with black text and better colors
-    def update_graph_layout(fig):
-        fig.update_layout(
-            font=dict(color='black', size=12, family='Poppins'),
-            title_font=dict(color='black', size=24),
-            plot_bgcolor='rgba(240, 247, 255, 0.5)',
-            paper_bgcolor='rgba(240, 247, 255, 0.5)',
-            xaxis=dict(
-                title_font=dict(color='black', size=14),
-                tickfont=dict(color='black', size=12),
-                gridcolor='rgba(0, 0, 0, 0.1)'
-            ),
-            yaxis=dict(
-                title_font=dict(color='black', size=14),
-                tickfont=dict(color='black', size=12),
-                gridcolor='rgba(0, 0, 0, 0.1)'
-            ),
-            legend=dict(
-                font=dict(color='black', size=12),
-                bgcolor='rgba(240, 247, 255, 0.5)'
-            )
-        )
-        return fig
+    ], key='analysis_type')
 
-    # Plot based on selection
     if analysis_type == "Customer Segmentation Overview":
         st.markdown("""
             <div class='segment'>
@@ -1216,7 +565,7 @@ def show_rfm_analysis():
         
         # Bar chart of segment counts
         fig_bar = px.bar(
-            segment_counts, 
+            summary.reset_index(), 
             x='RFM_Segment', 
             y='Count',
             color='RFM_Segment',
@@ -1230,13 +579,13 @@ def show_rfm_analysis():
         # Segment-wise metrics
         col1, col2, col3 = st.columns(3)
         with col1:
-            champions_pct = len(rfm[rfm['RFM_Segment'] == 'Champions']) / len(rfm) * 100
+            champions_pct = summary.loc['Champions', 'Share'] * 100
             st.metric("🏆 Champions", f"{champions_pct:.1f}%", "High Value")
         with col2:
-            loyal_pct = len(rfm[rfm['RFM_Segment'] == 'Loyal Customers']) / len(rfm) * 100
+            loyal_pct = summary.loc['Loyal Customers', 'Share'] * 100
             st.metric("💎 Loyal Customers", f"{loyal_pct:.1f}%", "Stable")
         with col3:
-            at_risk_pct = len(rfm[rfm['RFM_Segment'].isin(['At Risk', 'Lost'])]) / len(rfm) * 100
+            at_risk_pct = summary.loc[['At Risk', 'Lost'], 'Share'].sum() * 100
             st.metric("⚠ At Risk", f"{at_risk_pct:.1f}%", "Needs Attention")
 
     elif analysis_type == "Purchase Pattern Analysis":
@@ -1326,11 +675,8 @@ def show_rfm_analysis():
         """, unsafe_allow_html=True)
         
         # Segment performance metrics
-        segment_metrics = rfm.groupby('RFM_Segment').agg({
-            'Monetary': ['mean', 'sum'],
-            'Frequency': 'mean',
-            'Recency': 'mean'
-        }).round(2)
+        segment_metrics = summary[summary['Count'] > 0][
+            ['Avg_Monetary', 'Revenue', 'Avg_Frequency', 'Avg_Recency']].round(2)
         
         segment_metrics.columns = ['Avg Spend', 'Total Revenue', 'Avg Frequency', 'Avg Recency']
         segment_metrics = segment_metrics.reset_index()
@@ -1407,7 +753,7 @@ def show_rfm_analysis():
         st.plotly_chart(fig_revenue_trend, use_container_width=True)
 
         # Segment revenue contribution
-        segment_revenue = rfm.groupby('RFM_Segment')['Monetary'].sum().reset_index()
+        segment_revenue = summary['Revenue'].rename('Monetary').reset_index()
         segment_revenue['Percentage'] = (segment_revenue['Monetary'] / segment_revenue['Monetary'].sum() * 100).round(1)
         
         fig_revenue_pie = px.pie(
@@ -1432,6 +778,205 @@ def show_rfm_analysis():
                 f"{row['Percentage']}% of total revenue"
             )
 
+# Main RFM Analysis page
+@profiled_page
+def show_rfm_analysis():
+    # Define a function to get translations based on the selected language
+    def get_translations(language):
+        translations = {
+            'English': {
+                'title': 'RFM Analysis',
+                'theme': 'Theme Settings',
+                'refresh_rate': 'Data Refresh Rate',
+                'notifications': 'Notification Preferences',
+                'language': 'Language Settings'
+            },
+            'Spanish': {
+                'title': 'RFM Analysis',
+                'theme': 'Configuración de Tema',
+                'refresh_rate': 'Frecuencia de Actualización de Datos',
+                'notifications': 'Preferencias de Notificación',
+                'language': 'Configuración de Idioma'
+            },
+            'French': {
+                'title': 'RFM Analysis',
+                'theme': 'Paramètres de Thème',
+                'refresh_rate': 'Fréquence de Rafraîchissement des Données',
+                'notifications': 'Préférences de Notification',
+                'language': 'Paramètres de Langue'
+            },
+            'German': {
+                'title': 'RFM Analysis',
+                'theme': 'Thema Einstellungen',
+                'refresh_rate': 'Datenaktualisierungsrate',
+                'notifications': 'Benachrichtigungseinstellungen',
+                'language': 'Spracheinstellungen'
+            },
+            'Hindi': {
+                'title': 'RFM Analysis',
+                'theme': 'थीम सेटिंग्स',
+                'refresh_rate': 'डेटा रीफ्रेश दर',
+                'notifications': 'सूचना प्राथमिकताएँ',
+                'language': 'भाषा सेटिंग्स'
+            },
+            'Punjabi': {
+                'title': 'RFM Analysis',
+                'theme': 'ਥੀਮ ਸੈਟਿੰਗਜ਼',
+                'refresh_rate': 'ਡਾਟਾ ਰੀਫ੍ਰੈਸ਼ ਦਰ',
+                'notifications': 'ਸੂਚਨਾ ਪ੍ਰਾਥਮਿਕਤਾਵਾਂ',
+                'language': 'ਭਾਸ਼ਾ ਸੈਟਿੰਗਜ਼'
+            }
+        }
+        return translations.get(language, translations['English'])
+
+    # Load data
+    profile_mark('load')
+    tenant = current_tenant()
+    data = load_tenant_transactions(tenant)
+
+    # Streamlit Dashboard
+    profile_mark('layout')
+
+    # Page styles and the Light/Dark mode come from the shared stylesheet bundle
+    apply_styles('rfm-analysis', st.session_state.get('theme_mode', 'Light'))
+
+    # Initialize translations based on the selected language
+    language = st.sidebar.selectbox("Language:", ('English', 'Spanish', 'French', 'German', 'Hindi', 'Punjabi'))
+    translations = get_translations(language)
+
+    # Update the navbar to cover the full width and ensure links are functional
+    st.markdown(f"""
+    <div class="navbar">
+        <div class="nav-logo">
+            📊 <span style='color: #32CD32;'>RFM Analysis</span>
+        </div>
+        <div class="nav-items">
+            <a href="#dashboard" class="nav-item">
+                <i class="fas fa-chart-line"></i> Dashboard
+            </a>
+            <a href="#customers" class="nav-item">
+                <i class="fas fa-users"></i> Customers
+            </a>
+            <a href="#revenue" class="nav-item">
+                <i class="fas fa-dollar-sign"></i> Revenue
+            </a>
+            <a href="#settings" class="nav-item">
+                <i class="fas fa-cog"></i> Settings
+            </a>
+            <button class="translate-button nav-item" onclick="toggleTranslate()" fdprocessedid="3fmhjf">
+                🌐
+            </button>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Ensure Font Awesome is loaded for icons
+    st.markdown("""
+    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css">
+    """, unsafe_allow_html=True)
+
+    # Header with enhanced styling
+    st.markdown("""
+    <div class='header'>
+        <h1>✨ <span style='color: #32CD32;'>RFM Analysis</span></h1>
+        <img src='https://img.icons8.com/fluency/96/000000/customer-insight.png'/>
+        <p>RFM Analysis Dashboard</p>
+        <p>Analyze customer segments based on Recency, Frequency, and Monetary values</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Data Preview Button with Toggle and Enhanced Display
+    profile_mark('preview')
+    show_data_preview(data, tenant)
+
+    # Customer drill-down served from the sorted transaction index instead of a table scan
+    profile_mark('drilldown')
+    with st.expander("👤 Customer 360"):
+        show_customer_drilldown(tenant)
+
+    with st.expander("📥 Export Scores"):
+        show_export_panel(tenant)
+
+    # RFM scores for the chosen lookback window; every window comes from one cached
+    # multi-window table, so switching windows never re-aggregates the transactions
+    profile_mark('rfm_metrics')
+    window_label = st.selectbox("🗓️ Lookback window:", list(RFM_WINDOW_LABELS), index=len(RFM_WINDOW_LABELS) - 1,
+                                key='rfm_window')
+    window = RFM_WINDOW_LABELS[window_label]
+    rfm = get_tenant_datasets().window_rfm(tenant, window).copy(deep=False)
+    cube = get_tenant_datasets().score_cube(tenant, window)
+
+    # Metrics
+    profile_mark('kpis')
+    show_rfm_kpis(rfm)
+
+    # Add settings section in the sidebar
+    profile_mark('settings')
+    st.sidebar.title("Settings")
+
+    # Theme selection
+    st.sidebar.subheader("Select Mode")
+    st.sidebar.radio("Mode:", ('Light', 'Dark'), key='theme_mode')
+
+    # Data refresh rate; the worker is shared, so the latest choice applies to every session
+    st.sidebar.subheader(get_translations(language)['refresh_rate'])
+    refresh_worker = get_refresh_worker()
+    # Always show the server-wide interval; only an actual change by this user writes it back
+    rate_labels = {seconds: label for label, seconds in REFRESH_RATES.items()}
+    if refresh_worker.interval in rate_labels:
+        st.session_state.refresh_rate = rate_labels[refresh_worker.interval]
+    st.sidebar.selectbox("Refresh every:", list(REFRESH_RATES), key='refresh_rate',
+                         on_change=lambda: refresh_worker.set_interval(REFRESH_RATES[st.session_state.refresh_rate]))
+    refresh_status = refresh_worker.status()
+    if refresh_status['last_check']:
+        st.sidebar.caption(f"Last checked {dt.datetime.fromtimestamp(refresh_status['last_check']):%H:%M:%S}")
+    for failed_tenant, error in refresh_status['errors'].items():
+        st.sidebar.warning(f"Refresh failed for {failed_tenant}: {error}")
+
+    # Update page content based on selected language
+    translations = get_translations(language)
+
+    # Update all text elements with translations
+    # st.markdown(f"""
+    # <div class='header'>
+    #     <h1>✨ {translations['title']}</h1>
+    #     <p>{translations['theme']}</p>
+    #     <p>{translations['refresh_rate']}</p>
+    #     <p>{translations['notifications']}</p>
+    #     <p>{translations['language']}</p>
+    # </div>
+    # """, unsafe_allow_html=True)
+
+    # Update navbar with translations
+    st.markdown(f"""
+    <div class="navbar">
+        <div class="nav-logo">
+            📊 <span style='color: #32CD32;'>RFM Analysis</span>
+        </div>
+        <div class="nav-items">
+            <a href="#dashboard" class="nav-item">
+                <i class="fas fa-chart-line"></i> {translations['theme']}
+            </a>
+            <a href="#customers" class="nav-item">
+                <i class="fas fa-users"></i> {translations['refresh_rate']}
+            </a>
+            <a href="#revenue" class="nav-item">
+                <i class="fas fa-dollar-sign"></i> {translations['notifications']}
+            </a>
+            <a href="#settings" class="nav-item">
+                <i class="fas fa-cog"></i> {translations['language']}
+            </a>
+            <button class="translate-button nav-item" onclick="toggleTranslate()" fdprocessedid="3fmhjf">
+                🌐
+            </button>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Plot based on selection
+    profile_mark('charts')
+    show_analysis_chart(data, rfm, cube)
+
     # Concluding Lines
     st.markdown("""
     <div class='segment'>
@@ -1488,14 +1033,18 @@ def show_rfm_analysis():
     """, unsafe_allow_html=True)
 
 # Customers Analysis page
+@profiled_page
 def show_customers_analysis():
     st.title("👥 Customer Analysis")
+    apply_styles('customers')
     
     # Load the data
-    df = pd.read_csv('rfm_data.csv')
-    df['PurchaseDate'] = pd.to_datetime(df['PurchaseDate'])
+    profile_mark('load')
+    tenant = current_tenant()
+    df = load_tenant_transactions(tenant)
     
     # Calculate customer metrics
+    profile_mark('customer_metrics')
     customer_metrics = df.groupby('CustomerID').agg({
         'OrderID': 'count',
         'TransactionAmount': 'sum',
@@ -1505,6 +1054,7 @@ def show_customers_analysis():
     customer_metrics.columns = ['CustomerID', 'Total_Orders', 'Total_Spent', 'Days_Since_Last_Purchase']
     
     # Create three columns for key metrics
+    profile_mark('kpis')
     col1, col2, col3 = st.columns(3)
     
     with col1:
@@ -1531,6 +1081,7 @@ def show_customers_analysis():
         )
     
     # Customer Segments Analysis
+    profile_mark('segmentation')
     st.subheader("Customer Segments Analysis")
     
     # Define customer segments based on spending
@@ -1541,6 +1092,7 @@ def show_customers_analysis():
     )
     
     # Create two columns for charts
+    profile_mark('charts')
     col1, col2 = st.columns(2)
     
     with col1:
@@ -1566,16 +1118,13 @@ def show_customers_analysis():
         st.plotly_chart(fig, use_container_width=True)
     
     # Customer Activity Timeline
+    profile_mark('activity_timeline')
     st.subheader("Customer Activity Timeline")
     
-    # Monthly customer activity
-    monthly_activity = df.groupby(df['PurchaseDate'].dt.strftime('%Y-%m')).agg({
-        'CustomerID': 'nunique',
-        'OrderID': 'count',
-        'TransactionAmount': 'sum'
-    }).reset_index()
-    
+    # Monthly customer activity; active customers are merged from the daily sketches
+    monthly_activity = get_tenant_datasets().monthly_rollup(tenant).reset_index()
     monthly_activity.columns = ['Month', 'Active_Customers', 'Total_Orders', 'Total_Revenue']
+    monthly_activity['Month'] = monthly_activity['Month'].astype(str)
     
     fig = px.line(
         monthly_activity,
@@ -1586,21 +1135,31 @@ def show_customers_analysis():
     )
     fig.update_layout(height=400)
     st.plotly_chart(fig, use_container_width=True)
+    show_active_customers(tenant)
+    
+    # Cohort retention, from the cached cohort engine
+    profile_mark('cohorts')
+    st.subheader("Cohort Retention")
+    show_cohort_heatmap(tenant)
     
     # Top Customers Table
+    profile_mark('top_customers')
     st.subheader("Top 10 Customers")
     top_customers = customer_metrics.nlargest(10, 'Total_Spent')
     st.dataframe(top_customers)
 
 # Revenue Analysis page
+@profiled_page
 def show_revenue_analysis():
     st.title("💰 Revenue Analysis")
+    apply_styles('revenue')
     
     # Load the data
-    df = pd.read_csv('rfm_data.csv')
-    df['PurchaseDate'] = pd.to_datetime(df['PurchaseDate'])
+    profile_mark('load')
+    df = load_tenant_transactions()
     
     # Calculate revenue metrics
+    profile_mark('revenue_metrics')
     revenue_metrics = df.groupby(df['PurchaseDate'].dt.strftime('%Y-%m')).agg({
         'TransactionAmount': ['sum', 'mean', 'count']
     }).reset_index()
@@ -1608,6 +1167,7 @@ def show_revenue_analysis():
     revenue_metrics.columns = ['Month', 'Total_Revenue', 'Average_Order_Value', 'Number_of_Orders']
     
     # Create three columns for key metrics
+    profile_mark('kpis')
     col1, col2, col3 = st.columns(3)
     
     with col1:
@@ -1635,6 +1195,7 @@ def show_revenue_analysis():
         )
     
     # Revenue Trends
+    profile_mark('revenue_trends')
     st.subheader("Revenue Trends")
     
     # Create two columns for charts
@@ -1665,6 +1226,7 @@ def show_revenue_analysis():
         st.plotly_chart(fig, use_container_width=True)
     
     # Revenue Distribution
+    profile_mark('revenue_distribution')
     st.subheader("Revenue Distribution")
     
     # Daily revenue distribution
@@ -1680,97 +1242,29 @@ def show_revenue_analysis():
     st.plotly_chart(fig, use_container_width=True)
     
     # Top Revenue Days
+    profile_mark('top_days')
     st.subheader("Top 10 Revenue Days")
     top_days = daily_revenue.nlargest(10, 'TransactionAmount')
     st.dataframe(top_days)
 
 # ML Analysis page
+@profiled_page
 def show_ml_analysis():
     st.title("🤖 Machine Learning Analysis")
     
-    # Add custom CSS with animations
-    st.markdown("""
-        <style>
-        .ml-container {
-            animation: fadeIn 0.8s ease-out;
-            padding: 1.5rem;
-            background: rgba(255, 255, 255, 0.1);
-            border-radius: 10px;
-            margin-bottom: 1.5rem;
-        }
-        
-        .ml-header {
-            color: #4B0082;
-            margin-bottom: 1rem;
-            border-bottom: 2px solid #4B0082;
-            padding-bottom: 0.5rem;
-        }
-        
-        .info-box {
-            background: rgba(75, 0, 130, 0.05);
-            border-left: 4px solid #4B0082;
-            padding: 1rem;
-            margin: 1rem 0;
-            border-radius: 0 5px 5px 0;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    apply_styles('ml-analysis')
     
-    # Load data
-    file_path = 'rfm_data.csv'
+    # Same frame as rfm_data.build_ml_features, shared through the dataset cache
+    profile_mark('ml_features')
+    tenant = current_tenant()
     try:
-        data = pd.read_csv(file_path)
+        ml_data = get_tenant_datasets().ml_features(tenant).copy(deep=False)
     except FileNotFoundError:
         st.error("Data file not found. Please make sure 'rfm_data.csv' exists in the current directory.")
         return
     
-    # Convert PurchaseDate to datetime
-    data['PurchaseDate'] = pd.to_datetime(data['PurchaseDate'])
-    
-    # Define reference date for recency calculation
-    reference_date = dt.datetime(2023, 7, 1)
-    
-    # Calculate RFM metrics
-    rfm = data.groupby('CustomerID').agg({
-        'PurchaseDate': lambda x: (reference_date - x.max()).days,
-        'OrderID': 'count',
-        'TransactionAmount': 'sum'
-    }).reset_index()
-    
-    rfm.columns = ['CustomerID', 'Recency', 'Frequency', 'Monetary']
-    
-    # Filter out non-positive monetary values
-    rfm = rfm[rfm['Monetary'] > 0]
-    
-    # Add additional features for ML
-    customer_data = data.groupby('CustomerID').agg({
-        'PurchaseDate': [
-            lambda x: (x.max() - x.min()).days if len(x) > 1 else 0,  # Customer tenure
-            'count'  # Total transactions
-        ],
-        'TransactionAmount': [
-            'mean',  # Average order value
-            'std',   # Variability in spending
-            'sum'    # Total spending
-        ],
-        'ProductInformation': [
-            lambda x: x.nunique(),  # Product variety
-            'count'  # Total products purchased
-        ]
-    }).reset_index()
-    
-    # Flatten the column names
-    customer_data.columns = ['CustomerID', 'Tenure', 'TransactionCount', 
-                            'AvgOrderValue', 'SpendingStd', 'TotalSpending',
-                            'ProductVariety', 'TotalProducts']
-    
-    # Replace NaN values in SpendingStd with 0 (for customers with only one transaction)
-    customer_data['SpendingStd'].fillna(0, inplace=True)
-    
-    # Merge with RFM data
-    ml_data = pd.merge(rfm, customer_data, on='CustomerID')
-    
     # Create tabs for different ML analyses
+    profile_mark('ml_tabs')
     tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
         "Advanced Segmentation", 
         "Churn Prediction", 
@@ -1782,33 +1276,38 @@ def show_ml_analysis():
     ])
     
     with tab1:
-        st.markdown('<h3 class="ml-header">Advanced Customer Segmentation with K-Means</h3>', unsafe_allow_html=True)
-        
-        st.markdown("""
-        <div class="info-box">
-        K-Means clustering provides a more data-driven approach to customer segmentation compared to rule-based RFM segmentation.
-        This can reveal natural groupings in your customer base that might not be apparent with traditional methods.
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Features for clustering
-        cluster_features = ['Recency', 'Frequency', 'Monetary', 'Tenure', 'ProductVariety']
+        show_segmentation_tab(ml_data)
+
+# Advanced Segmentation tab; feature and cluster-count changes rerun only this tab
+@st.fragment
+def show_segmentation_tab(ml_data):
+    st.markdown('<h3 class="ml-header">Advanced Customer Segmentation with K-Means</h3>', unsafe_allow_html=True)
+    
+    st.markdown("""
+    <div class="info-box">
+    K-Means clustering provides a more data-driven approach to customer segmentation compared to rule-based RFM segmentation.
+    This can reveal natural groupings in your customer base that might not be apparent with traditional methods.
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # Features for clustering
+    cluster_features = ['Recency', 'Frequency', 'Monetary', 'Tenure', 'ProductVariety']
+    
+    # Allow user to select features
+    selected_features = st.multiselect(
+        "Select features for clustering:",
+        options=cluster_features,
+        default=cluster_features
+    )
+    
+    if not selected_features:
+        st.warning("Please select at least one feature for clustering.")
+    else:
+        # Number of clusters
+        n_clusters = st.slider("Number of clusters:", min_value=2, max_value=10, value=5)
         
-        # Allow user to select features
-        selected_features = st.multiselect(
-            "Select features for clustering:",
-            options=cluster_features,
-            default=cluster_features
-        )
+        # Prepare data for clustering
+        X = ml_data[selected_features].copy()
         
-        if not selected_features:
-            st.warning("Please select at least one feature for clustering.")
-        else:
-            # Number of clusters
-            n_clusters = st.slider("Number of clusters:", min_value=2, max_value=10, value=5)
-            
-            # Prepare data for clustering
-            X = ml_data[selected_features].copy()
-            
-            # Scale the data
-            scaler = StandardSca
+        # Scale the data
+        scaler = StandardSca
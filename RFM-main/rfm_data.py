@@ -0,0 +1,146 @@
+"""Data loading and customer feature building shared by the dashboard and offline tools."""
+import datetime as dt
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+DATA_FILE = 'rfm_data.csv'
+
+# Reference date for recency calculation
+REFERENCE_DATE = dt.datetime(2023, 7, 1)
+
+# RFM segment ladder: minimum RFM_Score for each segment, best first
+SEGMENT_LADDER = [
+    (9, 'Champions'),
+    (8, 'Loyal Customers'),
+    (7, 'Potential Loyalists'),
+    (6, 'Recent Customers'),
+    (5, 'Promising'),
+    (4, 'Need Attention'),
+    (3, 'At Risk'),
+]
+LOWEST_SEGMENT = 'Lost'
+SEGMENT_ORDER = [name for _, name in SEGMENT_LADDER] + [LOWEST_SEGMENT]
+
+# Lookback windows of the multi-window RFM table, in days before the reference date (None: all history)
+RFM_WINDOWS = {'90d': 90, '180d': 180, '365d': 365, 'all': None}
+
+ML_FEATURE_COLUMNS = ['Recency', 'Frequency', 'Monetary', 'Tenure', 'TransactionCount',
+                      'AvgOrderValue', 'SpendingStd', 'TotalSpending',
+                      'ProductVariety', 'TotalProducts']
+
+
+# Load the transaction file with PurchaseDate parsed
+def load_transactions(path=DATA_FILE):
+    data = pd.read_csv(path)
+    data['PurchaseDate'] = pd.to_datetime(data['PurchaseDate'])
+    return data
+
+
+# Recency/Frequency/Monetary per customer, same definition as the dashboard pages
+def compute_rfm(data, reference_date=REFERENCE_DATE):
+    rfm = data.groupby('CustomerID').agg(
+        LastPurchase=('PurchaseDate', 'max'),
+        Frequency=('OrderID', 'count'),
+        Monetary=('TransactionAmount', 'sum')
+    ).reset_index()
+    rfm.insert(1, 'Recency', (reference_date - rfm.pop('LastPurchase')).dt.days)
+
+    # Filter out non-positive monetary values
+    return rfm[rfm['Monetary'] > 0]
+
+
+def compute_rfm_windows(data, windows=RFM_WINDOWS, reference_date=REFERENCE_DATE):
+    """Recency/Frequency/Monetary of every customer for several lookback windows at once.
+
+    Customer codes and purchase ages are computed once. Each window is
+    then a boundary mask over the ages, with its frequencies and amounts
+    summed per customer by ``bincount``. Recency is the age of the latest
+    purchase whatever the window, so it is computed once and only masked
+    where the customer has no purchase inside the window. Returns one row
+    per customer with ``Recency_<window>`` (nullable), ``Frequency_<window>``
+    and ``Monetary_<window>`` columns; the 'all' window matches
+    ``compute_rfm`` before its Monetary filter.
+    """
+    codes, customers = pd.factorize(data['CustomerID'], sort=True)
+    age = (reference_date - data['PurchaseDate']).dt.days.to_numpy(dtype=np.int64)
+    counted = data['OrderID'].notna().to_numpy(dtype=np.float64)
+    amount = np.nan_to_num(data['TransactionAmount'].to_numpy(dtype=np.float64))
+
+    latest = np.full(len(customers), np.iinfo(np.int64).max)
+    np.minimum.at(latest, codes, age)
+
+    columns = {'CustomerID': customers}
+    for name, days in windows.items():
+        rows = slice(None) if days is None else age < days
+        frequency = np.bincount(codes[rows], counted[rows], minlength=len(customers)).astype(np.int64)
+        recency = pd.array(latest, dtype='Int64')
+        if days is not None:
+            recency[latest >= days] = pd.NA
+        columns[f'Recency_{name}'] = recency
+        columns[f'Frequency_{name}'] = frequency
+        columns[f'Monetary_{name}'] = np.bincount(codes[rows], amount[rows], minlength=len(customers))
+    return pd.DataFrame(columns)
+
+
+# One window of a compute_rfm_windows table in compute_rfm's shape: customers active in it,
+# with positive Monetary, and plain Recency/Frequency/Monetary columns
+def select_rfm_window(windows, name):
+    rfm = windows[['CustomerID', f'Recency_{name}', f'Frequency_{name}', f'Monetary_{name}']]
+    rfm.columns = ['CustomerID', 'Recency', 'Frequency', 'Monetary']
+    rfm = rfm[rfm['Frequency'].gt(0) & rfm['Monetary'].gt(0)].reset_index(drop=True)
+    return rfm.astype({'Recency': 'int64'})
+
+
+# Quartile scores and segments, vectorized over the customer table
+def score_rfm(rfm, ladder=SEGMENT_LADDER):
+    rfm = rfm.copy()
+    rfm['R_Score'] = pd.qcut(rfm['Recency'], 4, labels=[1, 2, 3, 4]).astype('int8')
+    rfm['F_Score'] = pd.qcut(rfm['Frequency'].rank(method='first'), 4, labels=[4, 3, 2, 1]).astype('int8')
+    rfm['M_Score'] = pd.qcut(rfm['Monetary'], 4, labels=[4, 3, 2, 1]).astype('int8')
+    rfm['RFM_Score'] = rfm['R_Score'] + rfm['F_Score'] + rfm['M_Score']
+    rfm['RFM_Segment'] = segment_scores(rfm['RFM_Score'], ladder)
+    return rfm
+
+
+# Map RFM scores to segment names with the ladder thresholds
+def segment_scores(scores, ladder=SEGMENT_LADDER):
+    values = np.asarray(scores)
+    segments = np.select([values >= threshold for threshold, _ in ladder],
+                         [name for _, name in ladder], default=LOWEST_SEGMENT)
+    return pd.Categorical(segments, categories=[name for _, name in ladder] + [LOWEST_SEGMENT])
+
+
+# Additional per-customer features used by the ML tabs
+def compute_customer_features(data):
+    customer_data = data.groupby('CustomerID').agg(
+        FirstPurchase=('PurchaseDate', 'min'),
+        LastPurchase=('PurchaseDate', 'max'),
+        TransactionCount=('PurchaseDate', 'count'),
+        AvgOrderValue=('TransactionAmount', 'mean'),
+        SpendingStd=('TransactionAmount', 'std'),
+        TotalSpending=('TransactionAmount', 'sum'),
+        ProductVariety=('ProductInformation', 'nunique'),
+        TotalProducts=('ProductInformation', 'count')
+    ).reset_index()
+
+    # Customer tenure is zero for single-purchase customers
+    customer_data.insert(1, 'Tenure', (customer_data.pop('LastPurchase') - customer_data.pop('FirstPurchase')).dt.days)
+
+    # Replace NaN values in SpendingStd with 0 (for customers with only one transaction)
+    customer_data['SpendingStd'] = customer_data['SpendingStd'].fillna(0)
+    return customer_data
+
+
+# RFM merged with the customer features, i.e. the `ml_data` frame of the ML page
+def build_ml_features(data, reference_date=REFERENCE_DATE):
+    return pd.merge(compute_rfm(data, reference_date), compute_customer_features(data), on='CustomerID')
+
+
+# Content hash of a frame, used to key caches and persisted models on the data version
+def dataset_fingerprint(frame):
+    row_hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    digest = hashlib.sha256(row_hashes.tobytes())
+    digest.update(','.join(map(str, frame.columns)).encode())
+    return digest.hexdigest()[:16]
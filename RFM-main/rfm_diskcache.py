@@ -0,0 +1,142 @@
+"""Size-capped on-disk cache of derived results that survives restarts and deploys."""
+import hashlib
+import os
+import threading
+
+import joblib
+
+from rfm_singleflight import SingleFlight
+
+RESULT_CACHE_DIR = 'result_cache'
+DEFAULT_MAX_MB = 1024
+
+MB = 1024 * 1024
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules whose code shapes the cached results; editing any of them starts a fresh cache generation
+CODE_MODULES = ('rfm_data.py', 'rfm_cache.py', 'rfm_forecasting.py', 'rfm_diskcache.py', 'rfm_cohorts.py',
+                'rfm_sketch.py', 'rfm_cube.py')
+
+
+def code_version(modules=CODE_MODULES, root=_HERE):
+    digest = hashlib.sha256()
+    for name in modules:
+        with open(os.path.join(root, name), 'rb') as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()[:12]
+
+
+class DiskCache:
+    """Joblib-pickled values under ``root``, keyed by any repr-stable key plus the code version.
+
+    Entries written by another code version are never read and are the
+    first to go when the cache is over ``max_bytes``; after them, the least
+    recently used entries are removed. A read refreshes the entry's
+    modification time, which is what the LRU order is based on. Writes are
+    atomic, so several processes may share one directory.
+    """
+
+    def __init__(self, root=RESULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB * MB, version=None):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be positive")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.version = version or code_version()
+        os.makedirs(root, exist_ok=True)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    def path(self, key):
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+        return os.path.join(self.root, f'{self.version}-{digest}.joblib')
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _load(self, key, default):
+        path = self.path(key)
+        try:
+            value = joblib.load(path)
+            os.utime(path)
+        # Missing, removed by another process, or unreadable after a library upgrade
+        except Exception:
+            return default
+        return value
+
+    def get(self, key, default=None):
+        marker = object()
+        value = self._load(key, marker)
+        self._count('misses' if value is marker else 'hits')
+        return default if value is marker else value
+
+    def put(self, key, value):
+        path = self.path(key)
+        tmp = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+        joblib.dump(value, tmp)
+        os.replace(tmp, path)
+        self._count('writes')
+        self.trim()
+
+    def get_or_compute(self, key, compute):
+        marker = object()
+        value = self.get(key, marker)
+        if value is not marker:
+            return value
+
+        def compute_once():
+            # Written by the previous flight or another process since our lookup
+            value = self._load(key, marker)
+            if value is marker:
+                value = compute()
+                self.put(key, value)
+            return value
+        return self._flight.do(key, compute_once)
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.endswith('.joblib'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((not entry.name.startswith(self.version + '-'), stat.st_mtime,
+                                    stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for _, _, size, _ in self._entries())
+
+    def trim(self):
+        """Delete entries until the cache fits ``max_bytes``; other code versions go first."""
+        entries = self._entries()
+        total = sum(size for _, _, size, _ in entries)
+        # Sort foreign versions first, then oldest first
+        for _, _, size, path in sorted(entries, key=lambda e: (not e[0], e[1])):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._count('evictions')
+
+    def clear(self):
+        for _, _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats.update(bytes=self.size(), max_bytes=self.max_bytes, version=self.version,
+                     hit_ratio=stats['hits'] / lookups if lookups else 0.0)
+        return stats
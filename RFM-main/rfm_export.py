@@ -0,0 +1,147 @@
+"""Chunked export of customer-level RFM scores, segments and model predictions.
+
+Example:
+    python rfm_export.py --output champions.csv.gz --segment Champions --start 2023-01-01
+"""
+import argparse
+import gzip
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from rfm_data import DATA_FILE, SEGMENT_ORDER, load_transactions
+from rfm_models import REGISTRY_DIR, ModelRegistry, customer_snapshot, model_scope
+
+EXPORT_FORMATS = ('csv', 'csv.gz', 'parquet')
+MIME_TYPES = {'csv': 'text/csv', 'csv.gz': 'application/gzip', 'parquet': 'application/vnd.apache.parquet'}
+CHUNK_ROWS = 100_000
+# Server-side directory for exports too large to hand to a browser download
+EXPORT_DIR = 'exports'
+
+
+# Export format implied by a file name, e.g. 'scores.csv.gz' -> 'csv.gz'
+def format_from_path(path):
+    for fmt in sorted(EXPORT_FORMATS, key=len, reverse=True):
+        if str(path).endswith('.' + fmt):
+            return fmt
+    raise ValueError(f"Cannot infer export format from '{path}', expected one of {EXPORT_FORMATS}")
+
+
+# Positions of the snapshot rows to export. Location and date filters keep the
+# customers with at least one purchase matching both; the date window is inclusive.
+def select_customers(snapshot, data=None, segments=None, locations=None, start=None, end=None):
+    mask = np.ones(len(snapshot), dtype=bool)
+    if segments:
+        mask &= snapshot['RFM_Segment'].astype(str).isin(segments).to_numpy()
+    if locations or start is not None or end is not None:
+        if data is None:
+            raise ValueError("Location and date filters need the transactions")
+        rows = np.ones(len(data), dtype=bool)
+        if locations:
+            rows &= data['Location'].isin(locations).to_numpy()
+        if start is not None:
+            rows &= (data['PurchaseDate'] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            rows &= (data['PurchaseDate'] < pd.Timestamp(end) + pd.Timedelta(days=1)).to_numpy()
+        mask &= snapshot['CustomerID'].isin(data['CustomerID'].to_numpy()[rows]).to_numpy()
+    return np.flatnonzero(mask)
+
+
+# Snapshot rows in slices of at most `chunk_rows`, so only one slice is materialised at a time
+def iter_chunks(snapshot, positions=None, chunk_rows=CHUNK_ROWS):
+    if chunk_rows < 1:
+        raise ValueError("chunk_rows must be positive")
+    if positions is None:
+        for begin in range(0, len(snapshot), chunk_rows):
+            yield snapshot.iloc[begin:begin + chunk_rows]
+    else:
+        for begin in range(0, len(positions), chunk_rows):
+            yield snapshot.iloc[positions[begin:begin + chunk_rows]]
+
+
+def _write_csv(chunks, stream, compress):
+    binary = gzip.GzipFile(fileobj=stream, mode='wb') if compress else stream
+    text = io.TextIOWrapper(binary, encoding='utf-8', newline='')
+    rows = 0
+    try:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(text, index=False, header=i == 0)
+            rows += len(chunk)
+        text.flush()
+    finally:
+        # Close the gzip trailer but leave the caller's stream open
+        text.detach()
+        if compress:
+            binary.close()
+    return rows
+
+
+def _write_parquet(chunks, stream):
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False,
+                                         schema=writer.schema if writer else None)
+            if writer is None:
+                writer = pq.ParquetWriter(stream, table.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_export(chunks, target, fmt=None):
+    """Write DataFrame chunks to a file path or a writable binary stream.
+
+    Chunks are encoded and written one at a time, so memory stays bounded
+    by the chunk size whatever the number of customers. ``fmt`` is one of
+    EXPORT_FORMATS and defaults to the one implied by a path target.
+    Returns the number of rows written.
+    """
+    fmt = fmt or format_from_path(target)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {EXPORT_FORMATS}")
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, 'wb') as stream:
+            return write_export(chunks, stream, fmt)
+    if fmt == 'parquet':
+        return _write_parquet(chunks, target)
+    return _write_csv(chunks, target, compress=fmt == 'csv.gz')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=DATA_FILE, help='transaction CSV (default: %(default)s)')
+    parser.add_argument('--output', required=True, help='.csv, .csv.gz or .parquet file, or - for stdout')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, help='defaults to the output file extension')
+    parser.add_argument('--registry', default=REGISTRY_DIR,
+                        help='model registry for churn/CLV predictions (default: %(default)s)')
+    parser.add_argument('--segment', action='append', choices=SEGMENT_ORDER, help='repeat for several')
+    parser.add_argument('--location', action='append', help='repeat for several')
+    parser.add_argument('--start', help='first purchase date of the window, YYYY-MM-DD')
+    parser.add_argument('--end', help='last purchase date of the window, YYYY-MM-DD')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    data = load_transactions(args.data)
+    registry = ModelRegistry(args.registry) if os.path.isdir(args.registry) else None
+    snapshot = customer_snapshot(data, registry, model_scope(args.data))
+    positions = select_customers(snapshot, data, args.segment, args.location, args.start, args.end)
+    chunks = iter_chunks(snapshot, positions, args.chunk_rows)
+    if args.output == '-':
+        rows = write_export(chunks, sys.stdout.buffer, args.format or 'csv')
+    else:
+        rows = write_export(chunks, args.output, args.format)
+    print(f"Exported {rows:,} customers", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Vectorized per-customer feature tables built from sorted transactions."""
+import numpy as np
+import pandas as pd
+
+from rfm_data import REFERENCE_DATE
+# Every builder here starts from transactions ordered by customer then date
+from rfm_index import sort_transactions
+
+
+# Days since the same customer's previous purchase, NaN on each customer's first purchase
+def inter_purchase_gaps(ordered):
+    gaps = ordered['PurchaseDate'].diff().dt.days
+    return gaps.where(ordered['CustomerID'].eq(ordered['CustomerID'].shift()))
+
+
+# Purchase cadence per customer for the "Next Purchase Prediction" tab
+def build_next_purchase_features(data, reference_date=REFERENCE_DATE, presorted=False):
+    ordered = data if presorted else sort_transactions(data)
+    gaps = inter_purchase_gaps(ordered).rename('Gap')
+    grouped = pd.concat([ordered[['CustomerID', 'PurchaseDate']], gaps], axis=1).groupby('CustomerID', sort=False)
+
+    features = grouped.agg(
+        PurchaseCount=('PurchaseDate', 'size'),
+        FirstPurchase=('PurchaseDate', 'first'),
+        LastPurchase=('PurchaseDate', 'last'),
+        GapMean=('Gap', 'mean'),
+        GapMedian=('Gap', 'median'),
+        GapStd=('Gap', 'std'),
+        LastGap=('Gap', 'last'),
+    )
+    features['Tenure'] = (features['LastPurchase'] - features['FirstPurchase']).dt.days
+    features['DaysSinceLast'] = (reference_date - features['LastPurchase']).dt.days
+
+    # Expected next purchase and how far past it the customer is; undefined for one-off buyers
+    features['ExpectedNextDate'] = features['LastPurchase'] + pd.to_timedelta(features['GapMean'], unit='D')
+    features['OverdueRatio'] = features['DaysSinceLast'] / features['GapMean'].replace(0, np.nan)
+
+    float_cols = ['GapMean', 'GapMedian', 'GapStd', 'LastGap', 'OverdueRatio']
+    features[float_cols] = features[float_cols].astype('float32')
+    features[['PurchaseCount', 'Tenure', 'DaysSinceLast']] = (
+        features[['PurchaseCount', 'Tenure', 'DaysSinceLast']].astype('int32'))
+    return features.drop(columns='FirstPurchase').reset_index()
+
+
+# Point-in-time training rows: features as of each cutoff T and labels over [T, T + horizon)
+def build_point_in_time_training_set(data, cutoffs, horizon_days=90, output=None):
+    """One sorted pass over transactions producing (customer, cutoff) training rows.
+
+    Per-row cumulative state (purchase count, spend, squared spend, distinct
+    products) is computed once. The snapshot of a customer at cutoff T is the
+    state at their last purchase strictly before T, so no feature sees
+    anything on or after T. Labels look at the purchases in
+    [T, T + horizon_days). Customers acquired after a cutoff get no row for
+    it. When ``output`` is given the table is also written there as Parquet.
+    """
+    ordered = sort_transactions(data)
+    n = len(ordered)
+    customers = ordered['CustomerID'].to_numpy()
+    days = ordered['PurchaseDate'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    amounts = ordered['TransactionAmount'].to_numpy(dtype=np.float64)
+    cutoff_days = np.unique(pd.to_datetime(pd.Index(cutoffs)).to_numpy().astype('datetime64[D]').astype(np.int64))
+
+    # Offsets of each customer's first row, for within-customer cumulative state
+    rows = np.arange(n)
+    new_customer = np.r_[True, customers[1:] != customers[:-1]]
+    start = np.maximum.accumulate(np.where(new_customer, rows, 0))
+    last_of_customer = np.r_[new_customer[1:], True]
+
+    def within_customer_cumsum(values):
+        total = np.cumsum(values)
+        return total - np.r_[0, total][start]
+
+    frequency = rows - start + 1
+    monetary = within_customer_cumsum(amounts)
+    squares = within_customer_cumsum(amounts ** 2)
+    first_product = ~ordered.duplicated(['CustomerID', 'ProductInformation']).to_numpy()
+    variety = within_customer_cumsum(first_product.astype(np.int64))
+
+    # Row i is the latest purchase before T for every cutoff T in (day_i, next_day_i]
+    next_day = np.where(last_of_customer, np.iinfo(np.int64).max, np.r_[days[1:], 0])
+    lo = np.searchsorted(cutoff_days, days, side='right')
+    hi = np.searchsorted(cutoff_days, next_day, side='right')
+    counts = hi - lo
+    snap = np.repeat(rows, counts)
+    cutoff_idx = np.repeat(lo, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+    cutoff = cutoff_days[cutoff_idx]
+
+    # Last row before T + horizon for the same customer, located on (customer rank, day) keys
+    customer_rank = np.cumsum(new_customer) - 1
+    bounds = np.r_[days, cutoff_days]
+    origin = bounds.min() if len(bounds) else 0
+    span = (bounds.max() if len(bounds) else 0) - origin + horizon_days + 2
+    keys = customer_rank * span + (days - origin)
+    targets = customer_rank[snap] * span + (cutoff + horizon_days - origin)
+    horizon_end = np.searchsorted(keys, targets, side='left') - 1
+
+    freq = frequency[snap]
+    spend = monetary[snap]
+    variance = (squares[snap] - spend ** 2 / freq) / np.maximum(freq - 1, 1)
+    training = pd.DataFrame({
+        'CustomerID': customers[snap],
+        'Cutoff': cutoff.astype('datetime64[D]').astype('datetime64[ns]'),
+        'Recency': (cutoff - days[snap]).astype(np.int32),
+        'Frequency': freq.astype(np.int32),
+        'Monetary': spend,
+        'Tenure': (days[snap] - days[start[snap]]).astype(np.int32),
+        'AvgOrderValue': spend / freq,
+        'SpendingStd': np.sqrt(np.clip(np.where(freq > 1, variance, 0.0), 0, None)),
+        'ProductVariety': variety[snap].astype(np.int32),
+        'FuturePurchases': (horizon_end - snap).astype(np.int32),
+        'FutureSpend': monetary[horizon_end] - spend,
+    })
+    training['Churned'] = (training['FuturePurchases'] == 0).astype(np.int8)
+    training = training.sort_values(['Cutoff', 'CustomerID'], ignore_index=True)
+    if output:
+        training.to_parquet(output, index=False)
+    return training
@@ -0,0 +1,235 @@
+"""Cached, parallel revenue forecasting per series with a vectorized exponential-smoothing fallback."""
+import hashlib
+import importlib.util
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from rfm_diskcache import DEFAULT_MAX_MB, MB, DiskCache
+from rfm_singleflight import SingleFlight
+
+# Above this many series 'auto' skips Prophet and uses the smoothing fallback
+PROPHET_MAX_SERIES = 20
+
+# Smoothing parameter grid searched per series by the fallback
+ALPHA_GRID = np.linspace(0.05, 0.95, 10)
+BETA_GRID = np.array([0.0, 0.05, 0.1, 0.2, 0.4])
+
+
+# Wide frame of revenue per period: one column per value of `by` (or a single 'Total' column)
+def build_series(data, by=None, freq='D', value='TransactionAmount'):
+    period = data['PurchaseDate'].dt.to_period(freq).dt.to_timestamp()
+    if by is None:
+        wide = data.groupby(period)[value].sum().to_frame('Total')
+    else:
+        wide = data.groupby([period, by])[value].sum().unstack(by)
+    wide.index.name = 'ds'
+    full_index = pd.period_range(wide.index.min(), wide.index.max(), freq=freq).to_timestamp()
+    return wide.reindex(full_index, fill_value=0).fillna(0).rename_axis('ds')
+
+
+def series_fingerprint(series):
+    digest = hashlib.sha256(series.to_numpy(dtype=np.float64).tobytes())
+    digest.update(series.index.to_numpy(dtype='datetime64[ns]').tobytes())
+    return digest.hexdigest()[:16]
+
+
+def prophet_available():
+    return importlib.util.find_spec('prophet') is not None
+
+
+# Worker: fit one Prophet model, or load an already fitted one, and forecast; runs in a separate process.
+# Returns the serialized model with the forecast so the fit can be cached.
+def _fit_prophet(ds, y, horizon, freq, model_json=None):
+    from prophet import Prophet
+    from prophet.serialize import model_from_json, model_to_json
+
+    if model_json is None:
+        model = Prophet()
+        model.fit(pd.DataFrame({'ds': ds, 'y': y}))
+        model_json = model_to_json(model)
+    else:
+        model = model_from_json(model_json)
+    future = model.make_future_dataframe(periods=horizon, freq=freq, include_history=False)
+    return model_json, model.predict(future)[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
+
+
+# Holt's linear smoothing over a (periods x series) matrix, grid-searching alpha/beta per series.
+# Returns the final level, trend and one-step residual sigma of every series.
+def holt_fit(values, alphas=ALPHA_GRID, betas=BETA_GRID):
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    n_periods, n_series = values.shape
+    # Every (alpha, beta) pair is evaluated for every series at once: shape (grid, series)
+    alpha = np.repeat(alphas, len(betas))[:, None]
+    beta = np.tile(betas, len(alphas))[:, None]
+    level = np.broadcast_to(values[0], (len(alpha), n_series)).copy()
+    trend = np.broadcast_to(values[1] - values[0] if n_periods > 1 else 0.0, level.shape).copy()
+    sse = np.zeros_like(level)
+    for t in range(1, n_periods):
+        error = values[t] - (level + trend)
+        sse += error ** 2
+        new_level = alpha * values[t] + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        level = new_level
+
+    best = sse.argmin(axis=0)
+    cols = np.arange(n_series)
+    return level[best, cols], trend[best, cols], np.sqrt(sse[best, cols] / max(n_periods - 1, 1))
+
+
+# Project fitted Holt parameters `horizon` periods ahead with a 95% band: (horizon x series) arrays
+def holt_project(level, trend, sigma, horizon):
+    steps = np.arange(1, horizon + 1)[:, None]
+    yhat = level + steps * trend
+    band = 1.96 * sigma * np.sqrt(steps)
+    return yhat, yhat - band, yhat + band
+
+
+def holt_forecast(values, horizon, alphas=ALPHA_GRID, betas=BETA_GRID):
+    return holt_project(*holt_fit(values, alphas, betas), horizon)
+
+
+class ForecastService:
+    """Forecasts keyed by series fingerprint, horizon and method.
+
+    Prophet fits run on one long-lived process pool, one series per task;
+    call ``close`` to shut it down. The vectorized Holt fallback forecasts
+    hundreds of series in one pass when Prophet is unavailable or there are
+    too many series. Fitted models (serialized Prophet models, Holt
+    level/trend/sigma) are cached by series fingerprint alongside the
+    forecasts, so a new horizon reuses the fit. Both are kept in memory and,
+    when ``cache_dir`` is set, in a disk cache capped at ``max_disk_mb`` that
+    survives restarts. Concurrent requests missing the same series share one
+    fitting run.
+    """
+
+    def __init__(self, cache_dir=None, max_workers=None, memory_slots=512, max_disk_mb=DEFAULT_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.memory_slots = memory_slots
+        self._disk = DiskCache(cache_dir, int(max_disk_mb * MB)) if cache_dir else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._pool = None
+        self._stats = {'hits': 0, 'misses': 0, 'model_hits': 0, 'prophet_fits': 0, 'smoothing_fits': 0}
+
+    def _key(self, series, horizon, method, freq):
+        return f"{method}-{freq}-{horizon}-{series_fingerprint(series)}"
+
+    # Fitted model of a series, whatever the horizon
+    def _model_key(self, series, method, freq):
+        return f"model-{method}-{freq}-{series_fingerprint(series)}"
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def close(self):
+        """Shut down the Prophet process pool; a later fit starts a new one."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        forecast = self._disk.get(key) if self._disk else None
+        if forecast is not None:
+            self._put(key, forecast, persist=False)
+        return forecast
+
+    def _put(self, key, forecast, persist=True):
+        with self._lock:
+            self._memory[key] = forecast
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_slots:
+                self._memory.popitem(last=False)
+        if persist and self._disk:
+            self._disk.put(key, forecast)
+
+    def _resolve_method(self, method, n_series):
+        if method == 'auto':
+            return 'prophet' if n_series <= PROPHET_MAX_SERIES and prophet_available() else 'smoothing'
+        if method not in ('prophet', 'smoothing'):
+            raise ValueError(f"Unknown method '{method}', expected 'auto', 'prophet' or 'smoothing'")
+        return method
+
+    def forecast(self, wide, horizon=30, method='auto', freq='D'):
+        """Forecast every column of a wide series frame; returns {column: forecast frame}.
+
+        Forecast frames have Prophet's ``ds``, ``yhat``, ``yhat_lower`` and
+        ``yhat_upper`` columns whichever method produced them.
+        """
+        method = self._resolve_method(method, wide.shape[1])
+        results, missing = {}, []
+        for name in wide.columns:
+            key = self._key(wide[name], horizon, method, freq)
+            cached = self._get(key)
+            if cached is None:
+                missing.append((name, key))
+            else:
+                results[name] = cached
+        with self._lock:
+            self._stats['hits'] += len(results)
+            self._stats['misses'] += len(missing)
+        if not missing:
+            return results
+
+        fitted = self._flight.do((method, tuple(key for _, key in missing)),
+                                 lambda: self._fit(wide, missing, horizon, method, freq))
+        for name, key in missing:
+            results[name] = fitted[key]
+        return {name: results[name] for name in wide.columns}
+
+    # Forecast the missing series, fitting those without a cached model; returns {cache key: forecast frame}
+    def _fit(self, wide, missing, horizon, method, freq):
+        model_keys = {name: self._model_key(wide[name], method, freq) for name, _ in missing}
+        models = {name: self._get(model_key) for name, model_key in model_keys.items()}
+        unfitted = [name for name, model in models.items() if model is None]
+
+        if method == 'prophet':
+            pool = self._executor()
+            futures = {name: pool.submit(_fit_prophet, wide.index, wide[name].to_numpy(), horizon, freq, models[name])
+                       for name, _ in missing}
+            fitted = {}
+            for name, future in futures.items():
+                models[name], fitted[name] = future.result()
+        else:
+            if unfitted:
+                for name, level, trend, sigma in zip(unfitted, *holt_fit(wide[unfitted].to_numpy())):
+                    models[name] = {'level': level, 'trend': trend, 'sigma': sigma}
+            names = [name for name, _ in missing]
+            yhat, lower, upper = holt_project(*(np.array([models[name][param] for name in names])
+                                                for param in ('level', 'trend', 'sigma')), horizon)
+            ds = pd.period_range(wide.index[-1], periods=horizon + 1, freq=freq)[1:].to_timestamp()
+            fitted = {name: pd.DataFrame({'ds': ds, 'yhat': yhat[:, i], 'yhat_lower': lower[:, i],
+                                          'yhat_upper': upper[:, i]})
+                      for i, name in enumerate(names)}
+
+        with self._lock:
+            self._stats['prophet_fits' if method == 'prophet' else 'smoothing_fits'] += len(unfitted)
+            self._stats['model_hits'] += len(missing) - len(unfitted)
+        for name in unfitted:
+            self._put(model_keys[name], models[name])
+        for name, key in missing:
+            self._put(key, fitted[name])
+        return {key: fitted[name] for name, key in missing}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, cached=len(self._memory))
+        stats['coalesced'] = self._flight.stats()['coalesced']
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,99 @@
+"""In-memory customer and transaction indexes for constant-time per-customer lookups."""
+import time
+
+import numpy as np
+import pandas as pd
+
+
+class CustomerIndex:
+    """Immutable CustomerID-keyed view of a customer snapshot.
+
+    Columns are held as numpy arrays and looked up through a hashed pandas
+    Index, so single and batch lookups never scan the table. Segment
+    members are pre-grouped by position for cheap paginated listing.
+    ``activity`` optionally carries the transactions the snapshot was built
+    from, so both are published and replaced together.
+    """
+
+    def __init__(self, snapshot, version=None, activity=None):
+        # Kept whole for bulk export; lookups go through the arrays below
+        self.snapshot = snapshot = snapshot.sort_values('CustomerID', ignore_index=True)
+        self.activity = activity
+        self.version = version
+        self.built_at = time.time()
+        self.columns = list(snapshot.columns)
+        self._arrays = {col: snapshot[col].to_numpy() for col in self.columns}
+        self._ids = pd.Index(snapshot['CustomerID'])
+        segments = snapshot['RFM_Segment'].astype(str)
+        self._segments = {name: positions for name, positions in segments.groupby(segments).indices.items()}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _record(self, pos):
+        return {col: _plain(self._arrays[col][pos]) for col in self.columns}
+
+    def get(self, customer_id):
+        pos = self._ids.get_indexer([customer_id])[0]
+        return None if pos < 0 else self._record(pos)
+
+    def get_many(self, customer_ids):
+        positions = self._ids.get_indexer(customer_ids)
+        return {'customers': [self._record(pos) for pos in positions if pos >= 0],
+                'missing': [cid for cid, pos in zip(customer_ids, positions) if pos < 0]}
+
+    def segment_sizes(self):
+        return {name: len(positions) for name, positions in self._segments.items()}
+
+    def page(self, segment=None, offset=0, limit=100):
+        if segment is None:
+            positions, total = range(offset, min(offset + limit, len(self))), len(self)
+        else:
+            members = self._segments.get(segment, np.empty(0, dtype=np.intp))
+            positions, total = members[offset:offset + limit], len(members)
+        return {'total': int(total), 'offset': offset, 'limit': limit,
+                'customers': [self._record(pos) for pos in positions]}
+
+
+# numpy scalars to JSON-friendly Python values
+def _plain(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+# Transactions in TransactionIndex order
+def sort_transactions(data):
+    return data.sort_values(['CustomerID', 'PurchaseDate'], kind='stable', ignore_index=True)
+
+
+class TransactionIndex:
+    """Transactions sorted by (CustomerID, PurchaseDate) with per-customer row offsets.
+
+    A customer's history is the contiguous slice ``[start, stop)`` of the
+    sorted frame, found through a hashed index of CustomerIDs, so fetching
+    one customer never scans the table. Pass ``presorted=True`` with the
+    output of ``sort_transactions`` to index a frame without copying it.
+    """
+
+    def __init__(self, data, presorted=False):
+        self.data = data if presorted else sort_transactions(data)
+        customers = self.data['CustomerID'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, customers[1:] != customers[:-1]]) if len(customers) else np.empty(0, int)
+        self._ids = pd.Index(customers[starts])
+        self._bounds = np.r_[starts, len(customers)]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, customer_id):
+        return customer_id in self._ids
+
+    def history(self, customer_id):
+        """One customer's transactions in date order; empty when the customer is unknown."""
+        pos = self._ids.get_indexer([customer_id])[0]
+        if pos < 0:
+            return self.data.iloc[0:0]
+        return self.data.iloc[self._bounds[pos]:self._bounds[pos + 1]]
@@ -0,0 +1,334 @@
+"""Churn and CLV model training with a persistent on-disk model registry."""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import (HistGradientBoostingClassifier, HistGradientBoostingRegressor,
+                              RandomForestClassifier, RandomForestRegressor)
+from sklearn.metrics import accuracy_score, mean_squared_error
+from sklearn.model_selection import train_test_split
+
+from rfm_data import REFERENCE_DATE, build_ml_features, score_rfm
+from rfm_features import build_point_in_time_training_set
+from rfm_singleflight import SingleFlight
+
+REGISTRY_DIR = 'model_registry'
+
+# Customers without a purchase in this many days count as churned
+CHURN_RECENCY_DAYS = 90
+
+CHURN_FEATURES = ['Frequency', 'Monetary', 'Tenure', 'AvgOrderValue', 'SpendingStd', 'ProductVariety']
+CLV_FEATURES = ['Recency', 'Frequency', 'Monetary', 'Tenure', 'AvgOrderValue', 'ProductVariety']
+
+# CLV is the spend over the next CLV_HORIZON_DAYS, learned from CLV_CUTOFFS past windows of that length
+CLV_HORIZON_DAYS = 30
+CLV_CUTOFFS = 4
+
+DEFAULT_LEARNER = 'random_forest'
+
+# Estimator per learner and task
+LEARNERS = {
+    'random_forest': {'churn': RandomForestClassifier, 'clv': RandomForestRegressor},
+    'hist_gradient_boosting': {'churn': HistGradientBoostingClassifier, 'clv': HistGradientBoostingRegressor},
+}
+
+# Histogram boosting bins features into max_bins buckets, trains on all cores
+# through OpenMP and stops once the validation score stops improving
+DEFAULT_PARAMS = {
+    'random_forest': {'n_estimators': 100, 'random_state': 42},
+    'hist_gradient_boosting': {'max_iter': 500, 'max_bins': 255, 'early_stopping': True,
+                               'validation_fraction': 0.1, 'n_iter_no_change': 10, 'random_state': 42},
+}
+
+
+# Target column for each task, derived from its training frame (see training_set)
+def churn_target(ml_data):
+    return (ml_data['Recency'] > CHURN_RECENCY_DAYS).astype(int)
+
+
+def clv_target(training):
+    return training['FutureSpend']
+
+
+# Point-in-time CLV rows: features as of each cutoff, spend over the following horizon as the label.
+# The features never see the window they predict, unlike `ml_data`, whose Monetary is the spend itself.
+def clv_training_set(data, reference_date=REFERENCE_DATE, horizon_days=CLV_HORIZON_DAYS, n_cutoffs=CLV_CUTOFFS):
+    cutoffs = [pd.Timestamp(reference_date) - pd.Timedelta(days=horizon_days * k) for k in range(1, n_cutoffs + 1)]
+    training = build_point_in_time_training_set(data, cutoffs, horizon_days)
+    if len(training) < 2:
+        raise ValueError(f"Not enough purchase history before {min(cutoffs):%Y-%m-%d} to train a CLV model")
+    return training
+
+
+TARGETS = {
+    'churn': churn_target,
+    'clv': clv_target,
+}
+
+TASK_FEATURES = {
+    'churn': CHURN_FEATURES,
+    'clv': CLV_FEATURES,
+}
+
+
+# Learner defaults overridden by any explicit hyperparameters
+def resolve_params(learner, params=None):
+    if learner not in LEARNERS:
+        raise ValueError(f"Unknown learner '{learner}', expected one of {sorted(LEARNERS)}")
+    return dict(DEFAULT_PARAMS[learner], **(params or {}))
+
+
+# Train a churn or CLV model on its training frame; returns the fitted model and its holdout metrics
+def train_model(task, ml_data, features=None, params=None, learner=DEFAULT_LEARNER):
+    if task not in TARGETS:
+        raise ValueError(f"Unknown task '{task}', expected one of {sorted(TARGETS)}")
+    features = list(features or TASK_FEATURES[task])
+    params = resolve_params(learner, params)
+    X_train, X_test, y_train, y_test = train_test_split(
+        ml_data[features], TARGETS[task](ml_data), test_size=0.2, random_state=42)
+
+    start = time.perf_counter()
+    model = LEARNERS[learner][task](**params).fit(X_train, y_train)
+    metrics = {'train_seconds': round(time.perf_counter() - start, 4)}
+
+    predictions = model.predict(X_test)
+    if task == 'churn':
+        metrics['accuracy'] = float(accuracy_score(y_test, predictions))
+    else:
+        metrics['rmse'] = float(np.sqrt(mean_squared_error(y_test, predictions)))
+    metrics['model_bytes'] = len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+    metrics['n_samples'] = len(ml_data)
+    if hasattr(model, 'n_iter_'):
+        metrics['n_iter'] = int(model.n_iter_)
+    return model, metrics
+
+
+# Train every learner on the same split and report time, size and accuracy side by side
+def compare_learners(task, ml_data, features=None, learners=None):
+    rows = []
+    for learner in learners or LEARNERS:
+        _, metrics = train_model(task, ml_data, features, learner=learner)
+        rows.append(dict(learner=learner, **metrics))
+    return pd.DataFrame(rows).set_index('learner')
+
+
+# Customer-level predictions for a fitted model over `ml_data`-shaped features
+def score_customers(task, model, ml_data, features):
+    scores = ml_data[['CustomerID']].copy()
+    if task == 'churn':
+        proba = model.predict_proba(ml_data[features])
+        # A model trained on a single class has no churn column
+        churned = list(model.classes_).index(1) if 1 in model.classes_ else None
+        scores['ChurnProbability'] = proba[:, churned] if churned is not None else 0.0
+        scores['ChurnPrediction'] = (scores['ChurnProbability'] >= 0.5).astype('int8')
+    elif task == 'clv':
+        scores['PredictedCLV'] = model.predict(ml_data[features])
+    else:
+        raise ValueError(f"Unknown task '{task}', expected one of {sorted(TARGETS)}")
+    return scores
+
+
+def _digest(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+# Scope of the "latest model" pointers: the data source a model was trained for, so tenants
+# never fall back to each other's models. The dashboard, API and CLIs agree on it for one file.
+def model_scope(data_path):
+    return os.path.abspath(data_path)
+
+
+class ModelRegistry:
+    """Serialized models and their metrics on local disk.
+
+    Entries are keyed by dataset fingerprint, task, feature set, learner and
+    hyperparameters. Recently used models stay in memory, so repeat loads
+    skip deserialization. When the data changes, the newest model of the same
+    lineage (task, features, learner, params) and scope (see model_scope) can be
+    served stale while a background thread retrains on the new data.
+    """
+
+    def __init__(self, root=REGISTRY_DIR, memory_slots=8, max_workers=1):
+        self.root = root
+        self.memory_slots = memory_slots
+        os.makedirs(root, exist_ok=True)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-retrain')
+        self._pending = {}
+        self._flight = SingleFlight()
+        self._stats = {'hits': 0, 'memory_hits': 0, 'misses': 0, 'stale_hits': 0,
+                       'trains': 0, 'background_trains': 0}
+
+    @staticmethod
+    def _lineage(task, features, params, learner):
+        return _digest({'task': task, 'features': list(features), 'learner': learner, 'params': params})
+
+    def key(self, fingerprint, task, features, params, learner=DEFAULT_LEARNER):
+        return _digest({'fingerprint': fingerprint, 'lineage': self._lineage(task, features, params, learner)})
+
+    def _pointer(self, lineage, scope=None):
+        suffix = '' if scope is None else f'-{_digest(scope)}'
+        return os.path.join(self.root, f'latest-{lineage}{suffix}.json')
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_slots:
+                self._memory.popitem(last=False)
+
+    def _read(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return self._memory[key]
+        path = os.path.join(self.root, key)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            return None
+        with open(os.path.join(path, 'meta.json')) as fh:
+            meta = json.load(fh)
+        entry = (joblib.load(os.path.join(path, 'model.joblib')), meta)
+        self._remember(key, entry)
+        return entry
+
+    # Look up an entry by its registry key
+    def get(self, key):
+        return self._read(key)
+
+    # Look up a model for this exact data version; None on a miss
+    def load(self, fingerprint, task, features, params, learner=DEFAULT_LEARNER):
+        entry = self._read(self.key(fingerprint, task, features, params, learner))
+        self._count('hits' if entry else 'misses')
+        return entry
+
+    # Persist a model and its metrics; an entry directory appears atomically and is never replaced
+    def save(self, fingerprint, task, features, params, model, metrics, learner=DEFAULT_LEARNER, scope=None):
+        key = self.key(fingerprint, task, features, params, learner)
+        lineage = self._lineage(task, features, params, learner)
+        meta = {'key': key, 'lineage': lineage, 'fingerprint': fingerprint, 'task': task,
+                'features': list(features), 'learner': learner, 'params': params, 'metrics': metrics,
+                'scope': scope, 'saved_at': time.time()}
+        staging = tempfile.mkdtemp(dir=self.root, prefix='.staging-')
+        joblib.dump(model, os.path.join(staging, 'model.joblib'))
+        with open(os.path.join(staging, 'meta.json'), 'w') as fh:
+            json.dump(meta, fh, indent=2, default=str)
+        try:
+            # Fails when the key directory exists, so concurrent readers never see it half-replaced
+            os.rename(staging, os.path.join(self.root, key))
+        except OSError:
+            # Another writer saved the same key first; keep its entry so everyone serves one model
+            shutil.rmtree(staging, ignore_errors=True)
+            existing = self._read(key)
+            if existing is None:
+                raise
+            model, meta = existing
+        pointer = os.path.join(self.root, f'.latest-{lineage}.{os.getpid()}-{threading.get_ident()}.tmp')
+        with open(pointer, 'w') as fh:
+            json.dump({'key': key}, fh)
+        os.replace(pointer, self._pointer(lineage, scope))
+        self._remember(key, (model, meta))
+        return meta
+
+    # Most recently saved model of a lineage for `scope`, whatever data version it was trained on
+    def latest(self, task, features, params, learner=DEFAULT_LEARNER, scope=None):
+        pointer = self._pointer(self._lineage(task, features, params, learner), scope)
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer) as fh:
+            return self.get(json.load(fh)['key'])
+
+    def _train_and_save(self, ml_data, fingerprint, task, features, params, learner, scope):
+        model, metrics = train_model(task, ml_data, features, params, learner)
+        meta = self.save(fingerprint, task, features, params, model, metrics, learner, scope)
+        self._count('trains')
+        return model, meta
+
+    def get_or_train(self, ml_data, fingerprint, task, features=None, params=None,
+                     learner=DEFAULT_LEARNER, background=True, scope=None):
+        """Return ``(model, meta)`` for the data version, training on a miss.
+
+        With ``background=True`` a miss that has an older model of the same
+        lineage and scope returns that model (``meta['stale']`` is True) and retrains in
+        a worker thread; otherwise training happens inline.
+        """
+        features = list(features or TASK_FEATURES[task])
+        params = resolve_params(learner, params)
+        entry = self.load(fingerprint, task, features, params, learner)
+        if entry:
+            return entry
+
+        key = self.key(fingerprint, task, features, params, learner)
+        previous = self.latest(task, features, params, learner, scope) if background else None
+        if previous is None:
+            # Sessions missing the same model at once wait for a single training run
+            return self._flight.do(key, lambda: self._read(key) or self._train_and_save(
+                ml_data, fingerprint, task, features, params, learner, scope))
+
+        with self._lock:
+            if key not in self._pending:
+                self._stats['background_trains'] += 1
+                future = self._executor.submit(self._train_and_save, ml_data, fingerprint,
+                                               task, features, params, learner, scope)
+                self._pending[key] = future
+                future.add_done_callback(lambda _: self._pending.pop(key, None))
+            self._stats['stale_hits'] += 1
+        model, meta = previous
+        return model, dict(meta, stale=True)
+
+    # Block until background retraining has finished
+    def wait(self):
+        for future in list(self._pending.values()):
+            future.result()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, pending=len(self._pending))
+        stats['coalesced_trains'] = self._flight.stats()['coalesced']
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+# Newest model of every task's default lineage for `learner` and `scope`, as {task: (model, meta)}
+def latest_models(registry, scope, learner=DEFAULT_LEARNER):
+    models = {}
+    for task in TASK_FEATURES:
+        if registry is None:
+            break
+        entry = registry.latest(task, TASK_FEATURES[task], resolve_params(learner), learner, scope)
+        if entry is not None:
+            models[task] = entry
+    return models
+
+
+# Scored RFM table plus each model's churn/CLV predictions, ordered by CustomerID
+def attach_predictions(scored, ml_data, models):
+    for task, (model, meta) in models.items():
+        scores = score_customers(task, model, ml_data, meta['features'])
+        scored = scored.merge(scores.drop(columns='ChurnPrediction', errors='ignore'), on='CustomerID')
+    return scored.sort_values('CustomerID', ignore_index=True)
+
+
+# Customer-level snapshot: RFM metrics, scores and segment, plus churn/CLV predictions when
+# models were trained for the same data source (`scope`, see model_scope)
+def customer_snapshot(data, registry=None, scope=None, reference_date=REFERENCE_DATE, learner=DEFAULT_LEARNER):
+    ml_data = build_ml_features(data, reference_date)
+    snapshot = score_rfm(ml_data[['CustomerID', 'Recency', 'Frequency', 'Monetary']])
+    models = latest_models(registry, scope, learner) if scope is not None else {}
+    return attach_predictions(snapshot, ml_data, models)
@@ -0,0 +1,126 @@
+"""Opt-in per-stage timing and memory instrumentation for the dashboard pages."""
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+PROFILE_LOG = 'profile_log.jsonl'
+
+MB = 1024 * 1024
+
+
+class Profiler:
+    """Collects the stages of one page run and appends a summary to a JSON lines log.
+
+    Stages are either nested ``span`` blocks or sequential ``mark`` laps,
+    where each mark closes the previous lap. Memory deltas come from
+    tracemalloc, so they cover allocations made through Python's allocators
+    (NumPy and pandas buffers included), and tracing only runs while a
+    profiler is active. tracemalloc is process-wide: deltas and the peak
+    include allocations by other threads (other sessions), and the peak is
+    reset whenever a profiled run starts. A disabled profiler records nothing.
+    """
+
+    _tracing = 0
+    _owns_tracing = False
+    _tracing_lock = threading.Lock()
+
+    def __init__(self, page, enabled=True, log_path=PROFILE_LOG):
+        self.page = page
+        self.enabled = enabled
+        self.log_path = log_path
+        self.spans = []
+        self.cache_stats = {}
+        self._stack = []
+        self._lap = None
+        self._started = None
+        self._summary = None
+
+    def start(self):
+        if self.enabled and self._started is None:
+            with Profiler._tracing_lock:
+                # Leave tracing alone if someone else turned it on
+                if Profiler._tracing == 0:
+                    Profiler._owns_tracing = not tracemalloc.is_tracing()
+                    if Profiler._owns_tracing:
+                        tracemalloc.start()
+                Profiler._tracing += 1
+                # Peak since this run started, not since tracing was turned on
+                tracemalloc.reset_peak()
+            self._started = time.perf_counter()
+        return self
+
+    def _open(self, stage):
+        self._stack.append(stage)
+        return stage, time.perf_counter(), tracemalloc.get_traced_memory()[0]
+
+    def _close(self, opened):
+        stage, start, memory = opened
+        self.spans.append({
+            'stage': stage,
+            'depth': len(self._stack) - 1,
+            'start_ms': round((start - self._started) * 1000, 3),
+            'ms': round((time.perf_counter() - start) * 1000, 3),
+            'mem_delta_mb': round((tracemalloc.get_traced_memory()[0] - memory) / MB, 3),
+        })
+        self._stack.pop()
+
+    @contextmanager
+    def span(self, stage):
+        if self._started is None or self._summary is not None:
+            yield
+            return
+        opened = self._open(stage)
+        try:
+            yield
+        finally:
+            self._close(opened)
+
+    def mark(self, stage):
+        """End the running lap, if any, and start a new one named ``stage``."""
+        if self._started is None or self._summary is not None:
+            return
+        if self._lap is not None:
+            self._close(self._lap)
+        self._lap = self._open(stage)
+
+    # Snapshot of cumulative hit/miss counters; finish() reports the change during this run
+    def track_cache(self, name, hits, misses):
+        if self._started is not None:
+            previous = self.cache_stats.get(name, {'hits_before': hits, 'misses_before': misses})
+            self.cache_stats[name] = dict(previous, hits=hits, misses=misses)
+
+    def finish(self):
+        if self._started is None:
+            return None
+        if self._summary is not None:
+            return self._summary
+        if self._lap is not None:
+            self._close(self._lap)
+            self._lap = None
+        _, peak = tracemalloc.get_traced_memory()
+        with Profiler._tracing_lock:
+            Profiler._tracing -= 1
+            if Profiler._tracing == 0 and Profiler._owns_tracing:
+                tracemalloc.stop()
+
+        caches = {}
+        for name, counts in self.cache_stats.items():
+            hits = counts['hits'] - counts['hits_before']
+            misses = counts['misses'] - counts['misses_before']
+            caches[name] = {'hits': hits, 'misses': misses,
+                            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0}
+        self._summary = {
+            'timestamp': time.time(),
+            'page': self.page,
+            'total_ms': round((time.perf_counter() - self._started) * 1000, 3),
+            'peak_traced_mb': round(peak / MB, 3),
+            'memory_scope': 'process',
+            'stages': self.spans,
+            'caches': caches,
+        }
+        if self.log_path:
+            with open(self.log_path, 'a') as fh:
+                fh.write(json.dumps(self._summary) + '\n')
+        return self._summary
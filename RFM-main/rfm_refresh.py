@@ -0,0 +1,105 @@
+"""Background refresh of tenant datasets so page loads never wait on a rebuild.
+
+Run as a script to warm the shared and on-disk caches before starting the
+dashboard or the API, e.g. as a deploy step:
+    python rfm_refresh.py --models
+"""
+import argparse
+import sys
+import threading
+import time
+
+from rfm_cache import TENANT_CONFIG_FILE, TenantDatasets, load_tenant_config
+from rfm_models import REGISTRY_DIR, ModelRegistry
+
+
+class RefreshWorker:
+    """Daemon thread that polls every tenant's data file at a fixed interval.
+
+    Changed tenants are rebuilt with TenantDatasets.refresh on this thread;
+    readers stay on the last complete version until the new one is
+    published. An interval of None pauses polling. A failed rebuild is
+    recorded and the previous version keeps being served. With ``warm_up``
+    the thread first runs TenantDatasets.warm_up, whatever the interval, so
+    a restarted server reloads its caches before sessions ask for them.
+    """
+
+    def __init__(self, datasets, interval=None, warm_up=False, registry=None):
+        self.datasets = datasets
+        self.interval = interval
+        self.warm_up = warm_up
+        self.registry = registry
+        self.last_check = None
+        self.last_refresh = {}
+        self.errors = {}
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='rfm-data-refresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def set_interval(self, seconds):
+        if seconds is not None and seconds <= 0:
+            raise ValueError("Refresh interval must be positive or None")
+        if seconds != self.interval:
+            self.interval = seconds
+            self._wake.set()
+
+    def run_once(self):
+        refreshed = []
+        for tenant in self.datasets.tenants:
+            try:
+                if self.datasets.refresh(tenant):
+                    self.last_refresh[tenant] = time.time()
+                    refreshed.append(tenant)
+                self.errors.pop(tenant, None)
+            except Exception as exc:
+                self.errors[tenant] = f"{type(exc).__name__}: {exc}"
+        self.last_check = time.time()
+        return refreshed
+
+    def _run(self):
+        if self.warm_up:
+            self.errors.update(self.datasets.warm_up(self.registry))
+            self.last_check = time.time()
+        while not self._stopped:
+            self._wake.clear()
+            if self.interval:
+                self.run_once()
+            self._wake.wait(self.interval)
+
+    def status(self):
+        return {'interval': self.interval, 'last_check': self.last_check,
+                'last_refresh': dict(self.last_refresh), 'errors': dict(self.errors)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Warm the dataset caches of every tenant.')
+    parser.add_argument('--config', default=TENANT_CONFIG_FILE, help='tenant config (default: %(default)s)')
+    parser.add_argument('--models', action='store_true', help='also train or load the churn and CLV models')
+    parser.add_argument('--registry', default=REGISTRY_DIR, help='model registry directory (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    datasets = TenantDatasets(load_tenant_config(args.config))
+    start = time.perf_counter()
+    errors = datasets.warm_up(ModelRegistry(args.registry) if args.models else None)
+    for tenant, error in errors.items():
+        print(f"{tenant}: {error}", file=sys.stderr)
+    disk = datasets.disk.stats() if datasets.disk else None
+    print(f"Warmed {len(datasets.tenants) - len(errors)} of {len(datasets.tenants)} tenants "
+          f"in {time.perf_counter() - start:.1f}s"
+          + (f"; result cache {disk['hits']} hits, {disk['writes']} writes, {disk['bytes'] / 2**20:.1f} MB"
+             if disk else ''))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Read-only frames published once as Arrow IPC files and memory-mapped by every reader.
+
+A frame published here is built by one process, written uncompressed in
+Arrow's IPC file format and then attached with a memory map. Numeric, date
+and string columns come back as views on the mapped file, so every session
+and every process attached to the same version shares one copy through the
+OS page cache instead of holding its own.
+"""
+import getpass
+import glob
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+import pyarrow as pa
+
+from rfm_singleflight import SingleFlight
+
+# Per user, so processes of one deployment share frames and other local users cannot plant them
+SHARED_DIR = os.path.join(tempfile.gettempdir(), f'rfm_shared-{getpass.getuser()}')
+
+
+# Create `root` private to this user, or refuse one that someone else could write files into
+def _private_dir(root):
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    if not hasattr(os, 'getuid'):
+        return
+    st = os.lstat(root)
+    if os.path.islink(root) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise PermissionError(f"Shared directory '{root}' must be a directory owned by this user "
+                              "and not writable by others")
+
+
+# Stable file stem for one artifact of a data file, the same in every process
+def frame_name(data_path, kind):
+    source = hashlib.sha1(os.path.abspath(data_path).encode()).hexdigest()[:10]
+    stem = re.sub(r'[^\w.-]', '_', os.path.splitext(os.path.basename(data_path))[0])
+    return f'{stem}-{source}-{kind}'
+
+
+def publish_frame(frame, path):
+    """Write ``frame`` to ``path`` as an Arrow IPC file; the file appears atomically."""
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    tmp = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+# Zero-copy, read-only DataFrame over a published file; safe to call from any process
+def attach_frame(path):
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+class SharedFrameStore:
+    """Versioned frames in a directory shared by sessions and worker processes.
+
+    ``get_or_publish`` attaches the file for ``(name, version)`` when some
+    process already published it and otherwise builds, publishes and
+    attaches it. Concurrent builds of one version in this process are
+    coalesced. Another process racing on the same version only repeats the
+    work, because the final rename is atomic.
+    """
+
+    def __init__(self, root=SHARED_DIR):
+        self.root = root
+        _private_dir(root)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {'attached': 0, 'published': 0}
+
+    def path(self, name, version):
+        return os.path.join(self.root, f'{name}@{version!r}.arrow')
+
+    def get_or_publish(self, name, version, build):
+        path = self.path(name, version)
+
+        def publish():
+            if not os.path.exists(path):
+                publish_frame(build(), path)
+                with self._lock:
+                    self._stats['published'] += 1
+            return path
+
+        if not os.path.exists(path):
+            self._flight.do(path, publish)
+        with self._lock:
+            self._stats['attached'] += 1
+        return attach_frame(path)
+
+    def discard_other_versions(self, name, version):
+        """Delete the files of every other version; readers that already attached keep working."""
+        keep = self.path(name, version)
+        for path in glob.glob(os.path.join(glob.escape(self.root), glob.escape(name) + '@*.arrow')):
+            if path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,67 @@
+"""Single-flight execution: concurrent requests for the same work share one computation."""
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time.
+
+    The first caller of a key runs ``compute``; callers arriving while it is
+    in progress block until it finishes and get the same result, or the same
+    exception. A key is forgotten once its computation completes, so pair
+    this with a cache to reuse finished results. ``compute`` must not request
+    its own key again, or it would wait on itself.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'executed': 0, 'coalesced': 0, 'failed': 0}
+
+    def do(self, key, compute):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['executed'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = compute()
+        except BaseException as exc:
+            call.error = exc
+            with self._lock:
+                self._stats['failed'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, in_flight=len(self._calls))
+        requests = stats['executed'] + stats['coalesced']
+        stats['coalesced_ratio'] = stats['coalesced'] / requests if requests else 0.0
+        return stats
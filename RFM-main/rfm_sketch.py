@@ -0,0 +1,232 @@
+"""HyperLogLog sketches for mergeable distinct-customer counts per day and location."""
+import numpy as np
+import pandas as pd
+
+# 2**12 registers per sketch: about 1.6% standard error
+DEFAULT_PRECISION = 12
+
+
+# Stable 64-bit hashes, the same in every process
+def hash_values(values):
+    return pd.util.hash_array(np.asarray(values))
+
+
+def _bit_length(values):
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= np.uint64(1 << shift)
+        length[high] += shift
+        values[high] >>= np.uint64(shift)
+    return length + (values > 0)
+
+
+# Register index and rank (position of the first 1 bit after the index bits) of each hash
+def register_updates(hashes, precision):
+    width = 64 - precision
+    index = (hashes >> np.uint64(width)).astype(np.intp)
+    rank = width - _bit_length(hashes & np.uint64((1 << width) - 1)) + 1
+    return index, rank.astype(np.uint8)
+
+
+def estimate(registers):
+    """Distinct-count estimate for the sketches on the last axis of ``registers``."""
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)), axis=-1)
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    # Linear counting is more accurate while many registers are still empty
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+def _check_precision(precision):
+    if not 4 <= precision <= 18:
+        raise ValueError(f"precision must be between 4 and 18, got {precision}")
+
+
+class HyperLogLog:
+    """Single sketch: ``add`` hashes values in, ``merge`` is the union of two sketches."""
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        _check_precision(precision)
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def add(self, values):
+        index, rank = register_updates(hash_values(values), self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches of different precision")
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    def count(self):
+        return int(round(float(estimate(self.registers))))
+
+
+# Bits of a packed sparse entry below the register index, holding the rank (at most 61)
+_RANK_BITS = 6
+# Bits of a bucket id holding the location code, below the day number
+_LOCATION_BITS = 20
+
+
+# Days since 1970-01-01 of each timestamp
+def _day_numbers(dates):
+    return np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+class DistinctSketches:
+    """One HyperLogLog sketch of distinct customers per (day, location) bucket.
+
+    Most buckets see a handful of customers, so a bucket starts sparse: a
+    sorted array of packed ``(bucket, register, rank)`` entries that keeps
+    only the registers that were set. A bucket is promoted to a dense row of
+    ``2**precision`` registers once its entries would take more memory than
+    the row, so memory follows the number of distinct (day, location,
+    customer) triples and is capped at the dense size per bucket, instead of
+    growing with every day and location pair. A count over any date range
+    and set of locations is a register-wise max over the selected buckets
+    followed by a single estimate. ``update`` adds transactions to the
+    existing buckets, and ``merge`` combines sketches built separately.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, key='CustomerID', by='Location'):
+        _check_precision(precision)
+        self.precision = precision
+        self.key = key
+        self.by = by
+        self._codes = pd.Index([], dtype=object)
+        self._sparse = np.empty(0, dtype=np.int64)
+        self._dense_buckets = np.empty(0, dtype=np.int64)
+        self._dense = np.zeros((0, 1 << precision), dtype=np.uint8)
+        self.days = pd.DatetimeIndex([])
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(1 << self.precision)
+
+    @property
+    def locations(self):
+        return self._codes.sort_values()
+
+    @property
+    def nbytes(self):
+        return self._sparse.nbytes + self._dense.nbytes + self._dense_buckets.nbytes
+
+    def _unpack(self, packed):
+        shift = self.precision + _RANK_BITS
+        registers = (packed >> _RANK_BITS) & ((1 << self.precision) - 1)
+        return packed >> shift, registers.astype(np.intp), (packed & ((1 << _RANK_BITS) - 1)).astype(np.uint8)
+
+    # Every set register as (bucket, register, rank), sparse and dense buckets alike
+    def _entries(self):
+        rows, registers = np.nonzero(self._dense)
+        buckets, sparse_registers, ranks = self._unpack(self._sparse)
+        return (np.concatenate([buckets, self._dense_buckets[rows]]),
+                np.concatenate([sparse_registers, registers]),
+                np.concatenate([ranks, self._dense[rows, registers]]))
+
+    def _add(self, days, locations, index, rank):
+        if (days < 0).any() or (days >> (63 - _LOCATION_BITS - self.precision - _RANK_BITS)).any():
+            raise ValueError("Sketch dates must not be before 1970 or too far in the future to pack")
+        self._codes = self._codes.append(pd.Index(pd.unique(locations), dtype=object).difference(self._codes))
+        if len(self._codes) > 1 << _LOCATION_BITS:
+            raise ValueError(f"Sketches support at most {1 << _LOCATION_BITS} locations")
+        buckets = (days << _LOCATION_BITS) | self._codes.get_indexer(locations)
+
+        # Registers of buckets that are already dense are set in place
+        rows = np.minimum(np.searchsorted(self._dense_buckets, buckets), max(len(self._dense_buckets) - 1, 0))
+        dense = self._dense_buckets[rows] == buckets if len(self._dense_buckets) else np.zeros(len(buckets), bool)
+        np.maximum.at(self._dense, (rows[dense], index[dense]), rank[dense])
+
+        # Sorting packed entries groups them by bucket and register, highest rank last
+        shift = self.precision + _RANK_BITS
+        packed = (buckets[~dense] << shift) | (index[~dense].astype(np.int64) << _RANK_BITS) | rank[~dense]
+        packed = np.sort(np.concatenate([self._sparse, packed]))
+        last = np.ones(len(packed), dtype=bool)
+        last[:-1] = (packed[1:] >> _RANK_BITS) != (packed[:-1] >> _RANK_BITS)
+        packed = packed[last]
+
+        # A sparse entry costs 8 bytes and a dense register 1, so busy buckets switch to a dense row
+        buckets = packed >> shift
+        ids, sizes = np.unique(buckets, return_counts=True)
+        busy = ids[sizes > (1 << self.precision) // 8]
+        if len(busy):
+            promoted = np.isin(buckets, busy)
+            order = np.argsort(np.concatenate([self._dense_buckets, busy]), kind='stable')
+            self._dense_buckets = np.concatenate([self._dense_buckets, busy])[order]
+            self._dense = np.concatenate([self._dense, np.zeros((len(busy), self._dense.shape[1]), np.uint8)])[order]
+            moved, registers, ranks = self._unpack(packed[promoted])
+            np.maximum.at(self._dense, (np.searchsorted(self._dense_buckets, moved), registers), ranks)
+            packed = packed[~promoted]
+        self._sparse = packed
+
+        all_days = np.unique(np.concatenate([self._sparse >> shift, self._dense_buckets]) >> _LOCATION_BITS)
+        self.days = pd.DatetimeIndex(all_days.astype('datetime64[D]'))
+
+    def update(self, data):
+        if data.empty:
+            return self
+        index, rank = register_updates(hash_values(data[self.key]), self.precision)
+        self._add(_day_numbers(data['PurchaseDate']), data[self.by].astype(object).to_numpy(), index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches of different precision")
+        merged = DistinctSketches(self.precision, self.key, self.by)
+        for part in (self, other):
+            buckets, registers, ranks = part._entries()
+            merged._add(buckets >> _LOCATION_BITS, part._codes.to_numpy()[buckets & ((1 << _LOCATION_BITS) - 1)],
+                        registers, ranks)
+        return merged
+
+    def _mask(self, buckets, start, end, locations):
+        days = buckets >> _LOCATION_BITS
+        mask = np.ones(len(buckets), dtype=bool)
+        if start is not None:
+            mask &= days >= _day_numbers(pd.Timestamp(start).normalize())
+        if end is not None:
+            mask &= days <= _day_numbers(pd.Timestamp(end).normalize())
+        if locations:
+            mask &= np.isin(buckets & ((1 << _LOCATION_BITS) - 1), self._codes.get_indexer(list(locations)))
+        return mask
+
+    # Registers merged per group: `group` maps selected bucket ids to rows 0..n_groups-1
+    def _merged(self, start, end, locations, group, n_groups):
+        registers = np.zeros((n_groups, 1 << self.precision), dtype=np.uint8)
+        buckets, index, rank = self._unpack(self._sparse)
+        selected = self._mask(buckets, start, end, locations)
+        np.maximum.at(registers, (group(buckets[selected]), index[selected]), rank[selected])
+        selected = self._mask(self._dense_buckets, start, end, locations)
+        np.maximum.at(registers, group(self._dense_buckets[selected]), self._dense[selected])
+        return registers
+
+    def count(self, start=None, end=None, locations=None):
+        """Estimated distinct customers between ``start`` and ``end`` (inclusive) in ``locations``."""
+        registers = self._merged(start, end, locations, lambda buckets: np.zeros(len(buckets), np.intp), 1)
+        return int(round(float(estimate(registers[0]))))
+
+    def count_by(self, freq='M', start=None, end=None, locations=None):
+        """Estimated distinct customers per period (e.g. 'D', 'W', 'M') of the selected buckets."""
+        buckets = np.concatenate([self._unpack(self._sparse)[0], self._dense_buckets])
+        buckets = buckets[self._mask(buckets, start, end, locations)]
+        if not len(buckets):
+            return pd.Series(dtype=np.int64)
+        days = np.unique(buckets >> _LOCATION_BITS)
+        day_periods = pd.DatetimeIndex(days.astype('datetime64[D]')).to_period(freq)
+        periods = day_periods.unique()
+        period_rows = periods.get_indexer(day_periods)
+
+        def group(buckets):
+            return period_rows[np.searchsorted(days, buckets >> _LOCATION_BITS)]
+        counts = estimate(self._merged(start, end, locations, group, len(periods)))
+        return pd.Series(np.round(counts).astype(np.int64), index=periods)
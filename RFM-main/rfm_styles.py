@@ -0,0 +1,128 @@
+"""Dashboard stylesheet compiled once from styles/*.css into a single versioned bundle.
+
+Page stylesheets are scoped to a ``rfm-page-<name>`` class and themes to a
+``rfm-theme-<name>`` class on ``.stApp``, so one bundle serves every page and
+switching page or theme only toggles classes.
+"""
+import functools
+import hashlib
+import json
+import os
+import re
+
+STYLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'styles')
+
+# Applied on every page
+GLOBAL_STYLESHEETS = ('base.css',)
+
+# Page name -> stylesheet applied only while that page is shown
+PAGE_STYLESHEETS = {
+    'rfm-analysis': 'rfm_analysis.css',
+    'ml-analysis': 'ml_analysis.css',
+}
+
+STYLE_ELEMENT_ID = 'rfm-stylesheet'
+
+_APP_SELECTOR = re.compile(r'^\.stApp(?![\w-])')
+
+
+def page_class(page):
+    return f'rfm-page-{page}'
+
+
+def theme_class(theme):
+    return f'rfm-theme-{theme.lower()}'
+
+
+# Drop comments and insignificant whitespace
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def _matching_brace(css, start):
+    depth = 0
+    for pos in range(start, len(css)):
+        if css[pos] == '{':
+            depth += 1
+        elif css[pos] == '}':
+            depth -= 1
+            if depth == 0:
+                return pos
+    raise ValueError("Unbalanced braces in stylesheet")
+
+
+def _scope_selector(selector, scope):
+    selector = selector.strip()
+    if _APP_SELECTOR.match(selector):
+        return '.stApp' + scope + selector[len('.stApp'):]
+    return f'.stApp{scope} {selector}'
+
+
+# Prefix every rule of minified CSS with `.stApp<scope>`; @keyframes and other at-rules pass through
+def scope_css(css, scope):
+    rules = []
+    pos = 0
+    while pos < len(css):
+        brace = css.find('{', pos)
+        if brace < 0:
+            break
+        end = _matching_brace(css, brace)
+        prelude, body = css[pos:brace].strip(), css[brace + 1:end]
+        if prelude.startswith(('@media', '@supports')):
+            rules.append(f'{prelude}{{{scope_css(body, scope)}}}')
+        elif prelude.startswith('@'):
+            rules.append(css[pos:end + 1].strip())
+        else:
+            rules.append(','.join(_scope_selector(sel, scope) for sel in prelude.split(',')) + f'{{{body}}}')
+        pos = end + 1
+    return ''.join(rules)
+
+
+@functools.lru_cache(maxsize=4)
+def _compile(style_dir, signature):
+    def read(name):
+        with open(os.path.join(style_dir, name), encoding='utf-8') as fh:
+            return minify_css(fh.read())
+
+    parts = [read(name) for name in GLOBAL_STYLESHEETS]
+    parts += [scope_css(read(name), '.' + page_class(page)) for page, name in PAGE_STYLESHEETS.items()]
+    css = ''.join(parts)
+    return css, hashlib.sha256(css.encode()).hexdigest()[:12]
+
+
+def compile_stylesheet(style_dir=STYLE_DIR):
+    """Return ``(css, version)``; recompiled only when one of the source files changes."""
+    names = GLOBAL_STYLESHEETS + tuple(PAGE_STYLESHEETS.values())
+    signature = tuple((name, os.path.getmtime(os.path.join(style_dir, name))) for name in names)
+    return _compile(style_dir, signature)
+
+
+# Script run from a component iframe: installs the bundle in the parent document once per
+# version, then sets the page and theme classes on .stApp
+def style_script(css, version, page, theme):
+    classes = [page_class(page), theme_class(theme)]
+    # Keep a literal "</style>" or "</script>" from ending the script early
+    css_literal = 'null' if css is None else json.dumps(css).replace('</', '<\\/')
+    return f"""<script>
+const doc = window.parent.document;
+let style = doc.getElementById({json.dumps(STYLE_ELEMENT_ID)});
+if (!style) {{
+    style = doc.createElement('style');
+    style.id = {json.dumps(STYLE_ELEMENT_ID)};
+    doc.head.appendChild(style);
+}}
+const css = {css_literal};
+if (css !== null && style.dataset.version !== {json.dumps(version)}) {{
+    style.textContent = css;
+    style.dataset.version = {json.dumps(version)};
+}}
+const app = doc.querySelector('.stApp');
+if (app) {{
+    [...app.classList].filter(c => c.startsWith('rfm-page-') || c.startsWith('rfm-theme-'))
+        .forEach(c => app.classList.remove(c));
+    app.classList.add(...{json.dumps(classes)});
+}}
+</script>"""